@@ -0,0 +1,19 @@
+"""
+/bench.py
+~~~~~~~~~
+
+Script to benchmark hot paths of irahorecka.com.
+"""
+
+from scripts.bench import bench_serialize, bench_validate
+
+if __name__ == "__main__":
+    print("Housing API serialization (rows/sec):")
+    for size, result in bench_serialize().items():
+        print(f"{size:>5} rows: {result['legacy']:>8} -> {result['current']:>8} ({result['speedup']}x)")
+    print("Housing API request validation (validations/sec):")
+    for name, result in bench_validate().items():
+        print(
+            f"{name:>8}: {result['legacy']:>8} -> {result['cold']:>8} cold ({result['cold_speedup']}x), "
+            f"{result['warm']:>8} warm ({result['warm_speedup']}x)"
+        )
@@ -10,18 +10,23 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_sqlalchemy import SQLAlchemy
 
+from irahorecka.cache import Cache
 from irahorecka.config import Config
+from irahorecka.json_provider import get_json_provider
 
 application = Flask(__name__)
 db = SQLAlchemy()
 limiter = Limiter(key_func=get_remote_address)
+cache = Cache()
 
 
 def create_app(config_class=Config):
     """Creates Flask application instance."""
     application.config.from_object(config_class)
+    application.json = get_json_provider(application.config.get("JSON_PROVIDER", "json"))(application)
     CORS(application)
     db.init_app(application)
+    cache.init_app(application)
 
     from irahorecka.main.routes import main
     from irahorecka.housing.routes import housing
@@ -10,17 +10,30 @@ from functools import partial
 
 from dotenv import load_dotenv
 
-from irahorecka.api.craigslisthousing.read.posts import read_craigslist_housing
+from irahorecka.api.craigslisthousing.read.posts import (
+    read_craigslist_housing,
+    read_craigslist_housing_page,
+    CraigslistHousingPage,
+)
+from irahorecka.api.craigslisthousing.read.map import read_craigslist_housing_map, CraigslistHousingMapPage
 from irahorecka.api.craigslisthousing.read.neighborhood import read_neighborhoods
+from irahorecka.api.craigslisthousing.read.sites import read_housing_config
+from irahorecka.api.craigslisthousing.read.stats import read_craigslist_housing_stats, CraigslistHousingStatsPage
+from irahorecka.api.craigslisthousing.write.duplicate import DUPLICATE_THRESHOLD
 from irahorecka.api.craigslisthousing.write.posts import write_craigslist_housing
-from irahorecka.api.craigslisthousing.update.clean import clean_craigslist_housing, rm_expired_craigslist_housing
+from irahorecka.api.craigslisthousing.update.clean import clean_craigslist_housing
+from irahorecka.api.craigslisthousing.update.expire import rm_expired_craigslist_housing
+from irahorecka.api.craigslisthousing.update.map import write_craigslist_housing_map
 from irahorecka.api.craigslisthousing.update.score import write_craigslist_housing_score
+from irahorecka.api.craigslisthousing.update.stats import write_craigslist_housing_stats
 from irahorecka.api.githubrepos.read import read_github_repos
 from irahorecka.api.githubrepos.write import write_github_repos
 
 load_dotenv()
 
 NEIGHBORHOODS = read_neighborhoods()
+# Registry of Craigslist housing sites and their areas - see config.yaml.
+HOUSING_CONFIG = read_housing_config()
 # Sourced from python-craigslist-meta.
 AREAS = [
     "East Bay Area",
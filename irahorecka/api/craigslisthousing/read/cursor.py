@@ -0,0 +1,52 @@
+"""
+/irahorecka/api/craigslisthousing/read/cursor.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to encode and decode opaque cursor tokens used for keyset (seek) pagination.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+# Sorting keys mapped to the attribute that is paired with `CraigslistHousing.id` to
+# build a unique, ordered keyset. E.g. `date_desc` --> (last_updated, id) descending.
+SORT_KEYS = {
+    "date_asc": "last_updated",
+    "date_desc": "last_updated",
+    "score_asc": "score",
+    "score_desc": "score",
+    # Relevance to the search `q` - requires a search and ranks the most relevant posts first.
+    "relevance_desc": "relevance",
+}
+
+
+def encode_cursor(sort_by, post):
+    """Encodes the keyset of `post` (a row with `id`, `last_updated`, `score` and, if searched, `relevance`) into an
+    opaque, URL-safe cursor token bound to the `sort_by` key."""
+    value = getattr(post, SORT_KEYS[sort_by])
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    token = json.dumps([sort_by, value, post.id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decodes a cursor token from `encode_cursor` into a (sort_by, value, id) tuple.
+    Raises ValueError if the token is malformed - used as a Cerberus coercer."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_by, value, id_ = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("malformed cursor") from e
+    if sort_by not in SORT_KEYS or not isinstance(id_, int):
+        raise ValueError("malformed cursor")
+    if SORT_KEYS[sort_by] == "last_updated":
+        try:
+            value = datetime.fromisoformat(value)
+        except TypeError as e:
+            raise ValueError("malformed cursor") from e
+    elif not isinstance(value, (int, float)):
+        raise ValueError("malformed cursor")
+    return sort_by, value, id_
@@ -0,0 +1,129 @@
+"""
+/irahorecka/api/craigslisthousing/read/geo.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to filter Craigslist housing posts by location.
+"""
+
+import math
+
+import numpy as np
+from sqlalchemy.sql import func, or_
+
+from irahorecka.models import db, CraigslistHousing
+
+# Coordinates of Guest Peninsula, Antarctica - written for posts without a lat or lon.
+MISSING_COORDINATES = (-76.299965, -148.003021)
+# Size of a grid cell in degrees of latitude and longitude (about 5.5 km of latitude).
+GEOCELL_DEGREES = 0.05
+# Rows of cells covered by a search before it's served by a single range of cells.
+GEOCELL_MAX_RANGES = 64
+# Mean radius of the Earth in km, and the km per degree of latitude.
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_RADIUS_KM = 500
+
+
+def get_geocell(lat, lon, degrees=GEOCELL_DEGREES):
+    """Returns the ID of the grid cell of size `degrees` containing `lat` and `lon`. Cells are numbered row
+    by row, so cells of a row have consecutive IDs. None for missing or invalid coordinates, which are never
+    matched by a location search."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if (lat, lon) == MISSING_COORDINATES or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return int(get_geocell_row(lat, degrees) * get_geocell_columns(degrees) + get_geocell_column(lon, degrees))
+
+
+def get_geocell_row(lat, degrees=GEOCELL_DEGREES):
+    """Returns the row of grid cells of size `degrees` containing latitude `lat`. Accepts NumPy arrays."""
+    return np.floor((lat + 90) / degrees).astype(np.int64)
+
+
+def get_geocell_column(lon, degrees=GEOCELL_DEGREES):
+    """Returns the column of grid cells of size `degrees` containing longitude `lon`. Accepts NumPy arrays."""
+    return np.floor((lon + 180) / degrees).astype(np.int64)
+
+
+def get_geocell_columns(degrees=GEOCELL_DEGREES):
+    """Returns the number of grid cells of size `degrees` per row of latitude."""
+    return round(360 / degrees) + 1
+
+
+def get_geocell_ranges(bbox, degrees=GEOCELL_DEGREES, max_ranges=GEOCELL_MAX_RANGES):
+    """Returns a list of tuples of the first and last IDs of grid cells of size `degrees` covering `bbox`
+    [west, south, east, north]. Cells of a row are consecutive - one range per row, or a single range
+    spanning every row if there are more than `max_ranges` rows."""
+    west, south, east, north = bbox
+    first_row, last_row = int(get_geocell_row(south, degrees)), int(get_geocell_row(north, degrees))
+    first_column, last_column = int(get_geocell_column(west, degrees)), int(get_geocell_column(east, degrees))
+    columns = get_geocell_columns(degrees)
+    if last_row - first_row >= max_ranges:
+        return [(first_row * columns + first_column, last_row * columns + last_column)]
+    return [(row * columns + first_column, row * columns + last_column) for row in range(first_row, last_row + 1)]
+
+
+def parse_coordinates(value):
+    """Coerces 'lat,lon' to a list of floats. Raises ValueError if out of range."""
+    lat, lon = (float(coordinate) for coordinate in value.split(","))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"coordinates out of range: {value}")
+    return [lat, lon]
+
+
+def parse_bbox(value):
+    """Coerces 'west,south,east,north' (degrees of longitude and latitude) to a list of floats. Raises
+    ValueError if out of range or empty."""
+    west, south, east, north = (float(coordinate) for coordinate in value.split(","))
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError(f"bounding box out of range or empty: {value}")
+    return [west, south, east, north]
+
+
+def filter_location(query, validated_args):
+    """Filters CraigslistHousing query by `bbox` or by `near` and `radius_km` in the request args. A search
+    is first narrowed by a spatial index - a GiST index of points on PostgreSQL, otherwise grid cells - then
+    matched exactly. Distances are measured on a flat projection around `near` - accurate to about 1% within
+    `MAX_RADIUS_KM` at the latitudes of Craigslist sites. Posts without coordinates are never matched."""
+    if validated_args.get("near") is not None:
+        lat, lon = validated_args["near"]
+        bbox = get_radius_bbox(lat, lon, validated_args["radius_km"])
+    elif validated_args.get("bbox") is not None:
+        bbox = validated_args["bbox"]
+    else:
+        return query
+    west, south, east, north = bbox
+    query = query.filter(
+        CraigslistHousing.geocell.isnot(None),
+        index_bbox_predicate(bbox),
+        CraigslistHousing.lat.between(south, north),
+        CraigslistHousing.lon.between(west, east),
+    )
+    if validated_args.get("near") is None:
+        return query
+    # Degrees of longitude shrink towards the poles - scale them to degrees of latitude at the center.
+    scale = math.cos(math.radians(lat))
+    dlat = CraigslistHousing.lat - lat
+    dlon = (CraigslistHousing.lon - lon) * scale
+    return query.filter(dlat * dlat + dlon * dlon <= (validated_args["radius_km"] / KM_PER_DEGREE) ** 2)
+
+
+def get_radius_bbox(lat, lon, radius_km):
+    """Returns the bounding box [west, south, east, north] of a circle of `radius_km` around `lat` and `lon`,
+    clamped to valid coordinates."""
+    dlat = radius_km / KM_PER_DEGREE
+    # Near the poles, the circle spans every longitude.
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return [max(lon - dlon, -180), max(lat - dlat, -90), min(lon + dlon, 180), min(lat + dlat, 90)]
+
+
+def index_bbox_predicate(bbox):
+    """Returns a SQL predicate of posts within `bbox` or nearby, served by the dialect's spatial index."""
+    west, south, east, north = bbox
+    if db.engine.dialect.name == "postgresql":
+        # Matches the expression of the GiST index declared on `CraigslistHousing`.
+        point = func.point(CraigslistHousing.lon, CraigslistHousing.lat)
+        return point.op("<@")(func.box(func.point(west, south), func.point(east, north)))
+    return or_(*(CraigslistHousing.geocell.between(first, last) for first, last in get_geocell_ranges(bbox)))
@@ -0,0 +1,95 @@
+"""
+/irahorecka/api/craigslisthousing/read/map.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to handle the validation and delivery of clusters of Craigslist housing posts on a map.
+"""
+
+import hashlib
+
+from sqlalchemy.sql import or_
+
+from irahorecka import cache
+from irahorecka.api.craigslisthousing.read.geo import get_geocell_ranges, parse_bbox
+from irahorecka.api.craigslisthousing.read.validator import RequestArgsValidator
+from irahorecka.api.craigslisthousing.update.map import get_map_cell_degrees, MAP_ZOOMS
+from irahorecka.api.version import read_data_version
+from irahorecka.exceptions import ValidationError
+from irahorecka.models import CraigslistHousingMapCell
+
+# Maximum number of grid cells covered by a request - a map view covers a few tiles.
+MAP_MAX_CELLS = 4096
+REQUEST_ARGS_SCHEMA = {
+    "site": {"type": "string", "required": True},
+    # Zoom levels without clusters are served the clusters of the nearest zoom level.
+    "zoom": {"type": "integer", "coerce": (float, int), "required": True},
+    "bbox": {"type": "list", "coerce": parse_bbox, "required": True},
+}
+REQUEST_ARGS_VALIDATOR = RequestArgsValidator(REQUEST_ARGS_SCHEMA)
+
+
+def read_craigslist_housing_map(request_args):
+    """ENTRY POINT: Reads query and returns clusters of Craigslist housing posts as a list of dictionaries,
+    one per grid cell with posts."""
+    return CraigslistHousingMapPage(request_args).read()
+
+
+class CraigslistHousingMapPage:
+    """ENTRY POINT: Clusters of Craigslist housing posts within a bounding box at a map zoom level. Validates
+    request args on instantiation and identifies the clusters by a strong ETag and the last refresh of the
+    clusters, without querying them. Clusters are only queried by `read`."""
+
+    def __init__(self, request_args):
+        self.validated_args = parse_request_args(request_args)
+        version, self.last_modified = read_data_version(CraigslistHousingMapCell.__tablename__)
+        self.key = repr((CraigslistHousingMapCell.__tablename__, version, sorted(self.validated_args.items())))
+        self.etag = hashlib.sha256(self.key.encode()).hexdigest()
+
+    def read(self):
+        """Returns a list of clusters. Cached until the clusters are next refreshed."""
+        return cache.get_or_set(self.key, lambda: fetch_housing_map(self.validated_args))
+
+
+def parse_request_args(request_args):
+    """Returns validated and normalized request args. Raises ValidationError if validation fails or the
+    bounding box covers more than `MAP_MAX_CELLS` cells at the zoom level."""
+    v_status, v_args = REQUEST_ARGS_VALIDATOR.validate(dict(request_args))
+    if not v_status:
+        raise ValidationError(v_args)
+    v_args["zoom"] = min(max(v_args["zoom"], MAP_ZOOMS[0]), MAP_ZOOMS[-1])
+    west, south, east, north = v_args["bbox"]
+    degrees = get_map_cell_degrees(v_args["zoom"])
+    if ((east - west) // degrees + 1) * ((north - south) // degrees + 1) > MAP_MAX_CELLS:
+        raise ValidationError({"bbox": [f"covers more than {MAP_MAX_CELLS} cells at zoom {v_args['zoom']}"]})
+    return v_args
+
+
+def fetch_housing_map(validated_args):
+    """Fetches clusters of grid cells covering the bounding box of `validated_args` from database. Returns
+    a list of dictionaries of each cluster's coordinates, number of posts and median price."""
+    zoom, bbox = validated_args["zoom"], validated_args["bbox"]
+    degrees = get_map_cell_degrees(zoom)
+    west, south, east, north = bbox
+    query = (
+        CraigslistHousingMapCell.query.filter(
+            CraigslistHousingMapCell.site == validated_args["site"],
+            CraigslistHousingMapCell.zoom == zoom,
+            or_(
+                *(
+                    CraigslistHousingMapCell.cell.between(first, last)
+                    for first, last in get_geocell_ranges(bbox, degrees)
+                )
+            ),
+            # Clusters sit within their cell - leave out cells of a single range that are off to the side.
+            CraigslistHousingMapCell.lon.between(west - degrees, east + degrees),
+            CraigslistHousingMapCell.lat.between(south - degrees, north + degrees),
+        )
+        .with_entities(
+            CraigslistHousingMapCell.lat,
+            CraigslistHousingMapCell.lon,
+            CraigslistHousingMapCell.count,
+            CraigslistHousingMapCell.price_median,
+        )
+        .order_by(CraigslistHousingMapCell.cell)
+    )
+    return [row._asdict() for row in query]
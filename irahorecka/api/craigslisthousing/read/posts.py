@@ -5,61 +5,203 @@
 Module to handle the validation and delivery of Craigslist posts from a query.
 """
 
-from datetime import datetime
+import hashlib
+import operator
 
-from cerberus import Validator
+from sqlalchemy.sql import tuple_
 
+from irahorecka import cache
+from irahorecka.api.craigslisthousing.read.cursor import decode_cursor, encode_cursor, SORT_KEYS
+from irahorecka.api.craigslisthousing.read.geo import filter_location, parse_bbox, parse_coordinates, MAX_RADIUS_KM
+from irahorecka.api.craigslisthousing.read.search import filter_search, get_relevance, MAX_QUERY_LENGTH
+from irahorecka.api.craigslisthousing.read.sites import read_housing_config
+from irahorecka.api.craigslisthousing.read.validator import RequestArgsValidator
+from irahorecka.api.craigslisthousing.read.vocabulary import read_vocabulary
+from irahorecka.api.version import read_data_version
 from irahorecka.exceptions import ValidationError
 from irahorecka.models import CraigslistHousing
 
+# Registry of Craigslist housing sites and their areas - see config.yaml.
+HOUSING_SITES = read_housing_config()["sites"]
+# Categorical attributes with a known set of values - matched exactly. Sites and areas are the registered ones.
+VOCABULARY = {
+    "site": list(HOUSING_SITES),
+    "area": sorted({area for areas in HOUSING_SITES.values() for area in areas}),
+    **read_vocabulary(),
+}
+# Categorical attributes without a known set of values - matched by substring.
+FREE_TEXT_ATTRS = ("neighborhood",)
+REQUEST_ARGS_SCHEMA = {
+    "id": {"type": "integer", "coerce": int, "default": 0},
+    # Cast to float then try to validate as integer. Set default limit to 50 posts per query.
+    "limit": {"type": "integer", "coerce": (float, int), "default": 50},
+    # Keyset pagination requires a deterministic order - default to newest posts first.
+    "sort_by": {"type": "string", "allowed": list(SORT_KEYS), "default": "date_desc"},
+    # Opaque token from a previous page, decoded to (sort_by, value, id).
+    "cursor": {"type": "list", "coerce": decode_cursor, "nullable": True, "default": None},
+    # An empty string (the default) means the attribute is not filtered.
+    **{attr: {"type": "string", "allowed": ["", *values], "default": ""} for attr, values in VOCABULARY.items()},
+    **{attr: {"type": "string", "default": ""} for attr in FREE_TEXT_ATTRS},
+    "min_bedrooms": {"type": "integer", "coerce": (float, int), "default": 0},
+    "max_bedrooms": {"type": "integer", "coerce": (float, int), "default": 10},
+    "min_ft2": {"type": "integer", "coerce": (float, int), "default": 0},
+    "max_ft2": {"type": "integer", "coerce": (float, int), "default": 1_000_000},
+    "min_price": {"type": "integer", "coerce": (float, int), "default": 0},
+    "max_price": {"type": "integer", "coerce": (float, int), "default": 100_000},
+    # Location searches - 'lat,lon' with a radius, or a bounding box 'west,south,east,north'. See `filter_location`.
+    "near": {"type": "list", "coerce": parse_coordinates, "nullable": True, "default": None},
+    "radius_km": {"type": "float", "coerce": float, "min": 0, "max": MAX_RADIUS_KM, "default": 5.0},
+    "bbox": {"type": "list", "coerce": parse_bbox, "nullable": True, "default": None},
+    # Full-text search of posts' title and amenities - see `filter_search`.
+    "q": {"type": "string", "coerce": str.strip, "maxlength": MAX_QUERY_LENGTH, "default": ""},
+}
+REQUEST_ARGS_VALIDATOR = RequestArgsValidator(REQUEST_ARGS_SCHEMA)
+# Scalar request args mapped to the CraigslistHousing attribute and comparison they filter by.
+SCALAR_FILTERS = {
+    "min_bedrooms": ("bedrooms", operator.ge),
+    "max_bedrooms": ("bedrooms", operator.le),
+    "min_ft2": ("ft2", operator.ge),
+    "max_ft2": ("ft2", operator.le),
+    "min_price": ("price", operator.ge),
+    "max_price": ("price", operator.le),
+}
+# Number of rows buffered from the database's server-side cursor when streaming posts.
+STREAM_BATCH_SIZE = 100
 
-def read_craigslist_housing(request_args, sort_by=None, limit=None, offset=None, minified=False):
+
+def read_craigslist_housing(request_args, sort_by=None, limit=None, cursor=None, minified=False):
     """ENTRY POINT: Reads query and yields Craigslist housing posts as dictionaries from database."""
-    # If there is a limit kwarg other than None, create or override request_args["limit"]
-    if limit is not None:
-        request_args["limit"] = limit
+    v_args = parse_request_args(request_args, sort_by, limit, cursor)
+    query = query_craigslist_housing(v_args)
+    if not minified:
+        yield from fetch_housing_content(query, v_args["limit"], v_args["q"])
+    else:
+        yield from fetch_housing_content_minified(query, v_args["limit"], v_args["q"])
+
+
+def read_craigslist_housing_page(request_args, sort_by=None, limit=None, cursor=None, minified=False):
+    """ENTRY POINT: Reads a page of query and returns a tuple of Craigslist housing posts as dictionaries
+    and an opaque cursor to the next page. The cursor is None if there are no more posts to read.
+    Pages are cached until the next write to the CraigslistHousing table."""
+    return CraigslistHousingPage(request_args, sort_by, limit, cursor, minified).read()
+
+
+class CraigslistHousingPage:
+    """ENTRY POINT: A page of Craigslist housing posts. Validates request args on instantiation and
+    identifies the page by a strong ETag and the last modification of the CraigslistHousing table,
+    without querying posts. Posts are only queried by `read`, `stream` and `next_cursor`."""
+
+    def __init__(self, request_args, sort_by=None, limit=None, cursor=None, minified=False):
+        self.validated_args = parse_request_args(request_args, sort_by, limit, cursor)
+        self.minified = minified
+        version, self.last_modified = read_data_version(CraigslistHousing.__tablename__)
+        # Validated args are normalized - equivalent requests share a key regardless of how they were written.
+        self.key = repr((CraigslistHousing.__tablename__, version, minified, sorted(self.validated_args.items())))
+        self.etag = hashlib.sha256(self.key.encode()).hexdigest()
+
+    def read(self):
+        """Returns a tuple of posts and the cursor to the next page. Pages are cached until the next
+        write to the CraigslistHousing table."""
+        return cache.get_or_set(self.key, lambda: fetch_housing_page(self.validated_args, self.minified))
+
+    def read_columns(self):
+        """Returns a tuple of detailed posts as columns - a dictionary of keys and lists of values, one
+        per post - and the cursor to the next page. Cached separately from `read`."""
+        return cache.get_or_set(repr((self.key, "columns")), lambda: fetch_housing_columns(self.validated_args))
+
+    def stream(self):
+        """Yields posts one at a time from a server-side cursor. Unlike `read`, the page is neither
+        materialized nor cached - memory stays flat regardless of the page's size."""
+        query = query_craigslist_housing(self.validated_args)
+        limit, q = self.validated_args["limit"], self.validated_args["q"]
+        if not self.minified:
+            yield from fetch_housing_content(query, limit, q)
+        else:
+            yield from fetch_housing_content_minified(query, limit, q)
+
+    def next_cursor(self):
+        """Returns the cursor to the next page without fetching the page's posts. Only the keyset of
+        the page's last post is selected. Use alongside `stream`."""
+        limit = self.validated_args["limit"]
+        if not limit:
+            return None
+        # The offset is bounded by the page's size, not its depth - the query is already seeked past
+        # previous pages.
+        last_post = (
+            query_craigslist_housing(self.validated_args)
+            .with_entities(
+                CraigslistHousing.id,
+                CraigslistHousing.last_updated,
+                CraigslistHousing.score,
+                *select_relevance(self.validated_args["q"]),
+            )
+            .offset(limit - 1)
+            .first()
+        )
+        return encode_cursor(self.validated_args["sort_by"], last_post) if last_post else None
+
+
+def parse_request_args(request_args, sort_by, limit, cursor):
+    """Returns validated and normalized request args. Raises ValidationError if validation fails."""
+    # Work on a copy - callers may pass in their Flask session's query params.
+    request_args = dict(request_args)
+    # If there is a kwarg other than None, create or override its key in request_args.
+    for key, value in (("sort_by", sort_by), ("limit", limit), ("cursor", cursor)):
+        if value is not None:
+            request_args[key] = value
     v_status, v_args = validate_request_args(request_args)
     # Raise ValidationError to caller if parsing of request args failed
     if not v_status:
         raise ValidationError(v_args)
+    # A cursor is only meaningful for the sort order it was issued for.
+    if v_args["cursor"] is not None and v_args["cursor"][0] != v_args["sort_by"]:
+        raise ValidationError({"cursor": ["cursor does not match sort_by"]})
+    if v_args["near"] is not None and v_args["bbox"] is not None:
+        raise ValidationError({"bbox": ["bbox and near are mutually exclusive"]})
+    if SORT_KEYS[v_args["sort_by"]] == "relevance" and not v_args["q"]:
+        raise ValidationError({"sort_by": [f"{v_args['sort_by']} requires q"]})
     # Set maximum limit to 3000 per call. Ensure limit is a positive value else limit is 0.
-    limit = min(max(v_args["limit"], 0), 3_000)
-    filtered_query = fetch_housing_query(v_args)
+    v_args["limit"] = min(max(v_args["limit"], 0), 3_000)
+    return v_args
+
+
+def query_craigslist_housing(validated_args):
+    """Returns the filtered, sorted and seeked CraigslistHousing query for `validated_args`."""
+    filtered_query = fetch_housing_query(validated_args)
     # Sort query by using sorting keys found in `sort_housing_query`.
     # E.g. `date_desc` --> sort posts' datetime in descending order.
-    sorted_query = sort_housing_query(filtered_query, sort_by)
-    if not minified:
-        yield from fetch_housing_content(sorted_query, limit, offset)
-    else:
-        yield from fetch_housing_content_minified(sorted_query, limit, offset)
+    sorted_query = sort_housing_query(filtered_query, validated_args["sort_by"], validated_args["q"])
+    # Skip posts that were served on previous pages.
+    return seek_housing_query(sorted_query, validated_args["sort_by"], validated_args["cursor"], validated_args["q"])
+
+
+def fetch_housing_page(validated_args, minified=False):
+    """Fetches a page of CraigslistHousing data from database. Returns a tuple of posts and the
+    cursor to the next page."""
+    limit = validated_args["limit"]
+    query = select_housing_content(query_craigslist_housing(validated_args), minified, validated_args["q"])
+    posts = query.limit(limit).all()
+    # A short page means the query is exhausted - don't hand out a cursor to an empty page.
+    next_cursor = encode_cursor(validated_args["sort_by"], posts[-1]) if posts and len(posts) == limit else None
+    build_post = build_housing_post_minified if minified else build_housing_post
+    return [build_post(post) for post in posts], next_cursor
+
+
+def fetch_housing_columns(validated_args):
+    """Fetches a page of CraigslistHousing data from database with detailed content as columns.
+    Returns a tuple of columns and the cursor to the next page."""
+    limit = validated_args["limit"]
+    query = select_housing_content(query_craigslist_housing(validated_args), q=validated_args["q"])
+    posts = query.limit(limit).all()
+    next_cursor = encode_cursor(validated_args["sort_by"], posts[-1]) if posts and len(posts) == limit else None
+    keys = [column["name"] for column in query.column_descriptions]
+    return build_housing_columns(keys, posts), next_cursor
 
 
 def validate_request_args(request_args):
     """Validates request args for proper data types. Coerce into desired datatype if initial
     validation passes, otherwise send error code and failure message to be returned to caller."""
-    # Declare schema within function - usually single query, single validation.
-    # Avoid worrying about performance impact from declaration.
-    schema = {
-        "id": {"type": "integer", "coerce": int, "default": 0},
-        # Cast to float then try to validate as integer. Set default limit to 50 posts per query.
-        "limit": {"type": "integer", "coerce": (float, int), "default": 50},
-        "area": {"type": "string", "default": ""},
-        "site": {"type": "string", "default": ""},
-        "neighborhood": {"type": "string", "default": ""},
-        "housing_type": {"type": "string", "default": ""},
-        "laundry": {"type": "string", "default": ""},
-        "parking": {"type": "string", "default": ""},
-        "min_bedrooms": {"type": "integer", "coerce": (float, int), "default": 0},
-        "max_bedrooms": {"type": "integer", "coerce": (float, int), "default": 10},
-        "min_ft2": {"type": "integer", "coerce": (float, int), "default": 0},
-        "max_ft2": {"type": "integer", "coerce": (float, int), "default": 1_000_000},
-        "min_price": {"type": "integer", "coerce": (float, int), "default": 0},
-        "max_price": {"type": "integer", "coerce": (float, int), "default": 100_000},
-    }
-    v = Validator(schema)
-    if not v.validate(request_args):
-        return (False, v.errors)
-    return (True, v.normalized(request_args))
+    return REQUEST_ARGS_VALIDATOR.validate(request_args)
 
 
 def fetch_housing_query(validated_args):
@@ -69,115 +211,145 @@ def fetch_housing_query(validated_args):
         # Not optimal in performance, but conforms to datatype of non-id-based queries.
         return CraigslistHousing.query.filter(CraigslistHousing.id == validated_args["id"])
     query = filter_categorical(CraigslistHousing.query, validated_args)
-    return filter_scalar(query, validated_args)
+    query = filter_scalar(query, validated_args)
+    query = filter_location(query, validated_args)
+    return filter_search(query, validated_args)
 
 
 def filter_categorical(query, validated_args):
-    """Filters CraigslistHousing categorical attributes from the requests query.
-    E.g. `neighborhood=fremont / union city / newark`."""
-    categorical_filter = {
-        "area": validated_args["area"],
-        "site": validated_args["site"],
-        "neighborhood": validated_args["neighborhood"],
-        "housing_type": validated_args["housing_type"],
-        "laundry": validated_args["laundry"],
-        "parking": validated_args["parking"],
-    }
-    for attr, value in categorical_filter.items():
-        query = query.filter(getattr(CraigslistHousing, attr).like("%%%s%%" % value))
+    """Filters CraigslistHousing categorical attributes from the requests query. Enumerated attributes
+    are matched exactly and free-text attributes by substring. E.g. `neighborhood=fremont`.
+    Attributes left empty are not filtered."""
+    for attr in VOCABULARY:
+        if validated_args[attr]:
+            query = query.filter(getattr(CraigslistHousing, attr) == validated_args[attr])
+    for attr in FREE_TEXT_ATTRS:
+        if validated_args[attr]:
+            query = query.filter(getattr(CraigslistHousing, attr).contains(validated_args[attr], autoescape=True))
     return query
 
 
 def filter_scalar(query, validated_args):
     """Filters CraigslistHousing scalar attributes from the requests query.
-    E.g. `min_price=1000`."""
-    return (
-        query.filter(CraigslistHousing.bedrooms >= validated_args["min_bedrooms"])
-        .filter(CraigslistHousing.bedrooms <= validated_args["max_bedrooms"])
-        .filter(CraigslistHousing.ft2 >= validated_args["min_ft2"])
-        .filter(CraigslistHousing.ft2 <= validated_args["max_ft2"])
-        .filter(CraigslistHousing.price >= validated_args["min_price"])
-        .filter(CraigslistHousing.price <= validated_args["max_price"])
-    )
+    E.g. `min_price=1000`. Bounds equal to their schema default are not filtered."""
+    for arg, (attr, compare) in SCALAR_FILTERS.items():
+        if validated_args[arg] != REQUEST_ARGS_SCHEMA[arg]["default"]:
+            query = query.filter(compare(getattr(CraigslistHousing, attr), validated_args[arg]))
+    return query
 
 
-def sort_housing_query(query, sort_by):
+def sort_housing_query(query, sort_by, q=""):
     """Sorts CraigslistHousing query by CraigslistHousing attributes via sort_by keys.
-    The established keys are: 'date_asc', 'date_desc', 'score_asc', and 'score_desc'."""
-    sort_expr = {
-        "date_asc": lambda q: q.order_by(CraigslistHousing.last_updated.asc()),
-        "date_desc": lambda q: q.order_by(CraigslistHousing.last_updated.desc()),
-        "score_asc": lambda q: q.order_by(CraigslistHousing.score.asc()),
-        "score_desc": lambda q: q.order_by(CraigslistHousing.score.desc()),
-    }
-    if not sort_expr.get(sort_by):
+    The established keys are: 'date_asc', 'date_desc', 'score_asc', 'score_desc' and 'relevance_desc'
+    (relevance to search `q`). Ties are broken by post ID so that every sort order is a unique keyset."""
+    if sort_by not in SORT_KEYS:
         return query
-    return sort_expr[sort_by](query)
+    sort_column = get_sort_column(sort_by, q)
+    if sort_by.endswith("_desc"):
+        return query.order_by(sort_column.desc(), CraigslistHousing.id.desc())
+    return query.order_by(sort_column.asc(), CraigslistHousing.id.asc())
 
 
-def fetch_housing_content(query, limit, offset):
-    """Fetches CraigslistHousing data from database with detailed content."""
+def seek_housing_query(query, sort_by, cursor, q=""):
+    """Seeks CraigslistHousing query past the (value, id) keyset decoded from `cursor` in the
+    direction of `sort_by`. Unlike an offset, rows before the cursor are never read."""
+    if cursor is None:
+        return query
+    _, value, id_ = cursor
+    keyset = tuple_(get_sort_column(sort_by, q), CraigslistHousing.id)
+    if sort_by.endswith("_desc"):
+        return query.filter(keyset < (value, id_))
+    return query.filter(keyset > (value, id_))
+
+
+def get_sort_column(sort_by, q=""):
+    """Returns the column paired with `CraigslistHousing.id` in the keyset of `sort_by` - an attribute
+    of CraigslistHousing, or the relevance of posts to search `q`."""
+    if SORT_KEYS[sort_by] == "relevance":
+        return get_relevance(q)
+    return getattr(CraigslistHousing, SORT_KEYS[sort_by])
+
+
+def select_relevance(q):
+    """Returns a tuple of the relevance of posts to search `q` labeled 'relevance' - empty without a search."""
+    return (get_relevance(q).label("relevance"),) if q else ()
+
+
+def select_housing_content(query, minified=False, q=""):
+    """Selects CraigslistHousing columns required to build posts. Both selections carry the
+    keyset columns (`id`, `last_updated`, `score`, and `relevance` when searching `q`) needed to
+    encode a cursor. The detailed selection's columns are exactly the keys of `build_housing_post`."""
     # Apparently, instantiation of a CraigslistHousing object is negated if we work with entities
     # because we work with tuples of column data - good for speed.
     # fmt: off
-    posts = query.with_entities(
+    if minified:
+        return query.with_entities(
+            CraigslistHousing.id, CraigslistHousing.last_updated, CraigslistHousing.url, CraigslistHousing.title,
+            CraigslistHousing.price, CraigslistHousing.bedrooms, CraigslistHousing.score, *select_relevance(q),
+        )
+    return query.with_entities(
         CraigslistHousing.id, CraigslistHousing.repost_of, CraigslistHousing.last_updated, CraigslistHousing.url,
         CraigslistHousing.site, CraigslistHousing.area, CraigslistHousing.neighborhood, CraigslistHousing.address,
         CraigslistHousing.lat, CraigslistHousing.lon, CraigslistHousing.title, CraigslistHousing.price,
         CraigslistHousing.housing_type, CraigslistHousing.bedrooms, CraigslistHousing.flooring, CraigslistHousing.is_furnished,
         CraigslistHousing.no_smoking, CraigslistHousing.ft2, CraigslistHousing.laundry, CraigslistHousing.rent_period,
-        CraigslistHousing.parking, CraigslistHousing.misc, CraigslistHousing.score,
-    ).limit(limit).offset(offset)
+        CraigslistHousing.parking, CraigslistHousing.misc, CraigslistHousing.score, *select_relevance(q),
+    )
     # fmt: on
-    for post in posts:
-        yield {
-            # Metadata
-            "id": post.id,
-            "repost_of": post.repost_of,
-            "last_updated": datetime.strftime(post.last_updated, "%Y-%m-%d %H:%M"),
-            "url": post.url,
-            # Location
-            "site": post.site,
-            "area": post.area,
-            "neighborhood": post.neighborhood,
-            "address": post.address,
-            "lat": post.lat,
-            "lon": post.lon,
-            # Post
-            "title": post.title,
-            "price": f"${post.price}",
-            "housing_type": post.housing_type,
-            # Bedrooms in model is float type.
-            "bedrooms": int(post.bedrooms),
-            "flooring": post.flooring,
-            "is_furnished": post.is_furnished,
-            "no_smoking": post.no_smoking,
-            "ft2": post.ft2,
-            "laundry": post.laundry,
-            "rent_period": post.rent_period,
-            "parking": post.parking,
-            "misc": post.misc.split(";"),
-            # Score in model is float type.
-            "score": int(post.score),
-        }
-
-
-def fetch_housing_content_minified(query, limit, offset):
+
+
+def fetch_housing_content(query, limit, q=""):
+    """Fetches CraigslistHousing data from database with detailed content."""
+    for post in select_housing_content(query, q=q).limit(limit).yield_per(STREAM_BATCH_SIZE):
+        yield build_housing_post(post)
+
+
+def fetch_housing_content_minified(query, limit, q=""):
     """Fetches CraigslistHousing data from database with minified content."""
-    # fmt: off
-    posts = query.with_entities(
-        CraigslistHousing.last_updated, CraigslistHousing.url, CraigslistHousing.title, CraigslistHousing.price,
-        CraigslistHousing.bedrooms, CraigslistHousing.score,
-    ).limit(limit).offset(offset)
-    # fmt: on
-    for post in posts:
-        yield {
-            # Metadata
-            "last_updated": datetime.strftime(post.last_updated, "%Y-%m-%d %H:%M"),
-            "url": post.url,
-            # Post
-            "title": post.title,
-            "price": f"${post.price}",
-            "bedrooms": int(post.bedrooms),
-            "score": int(post.score),
-        }
+    for post in select_housing_content(query, True, q).limit(limit).yield_per(STREAM_BATCH_SIZE):
+        yield build_housing_post_minified(post)
+
+
+def build_housing_post(post):
+    """Builds a detailed post dictionary from a row selected by `select_housing_content`. The row's
+    labels are the post's keys - only values that need reformatting are overwritten."""
+    content = post._asdict()
+    content["last_updated"] = format_last_updated(post.last_updated)
+    content["price"] = f"${post.price}"
+    # Bedrooms and score in model are float type.
+    content["bedrooms"] = int(post.bedrooms)
+    content["misc"] = post.misc.split(";")
+    content["score"] = int(post.score)
+    return content
+
+
+def build_housing_post_minified(post):
+    """Builds a minified post dictionary from a row selected by `select_housing_content`."""
+    return {
+        # Metadata
+        "last_updated": format_last_updated(post.last_updated),
+        "url": post.url,
+        # Post
+        "title": post.title,
+        "price": f"${post.price}",
+        "bedrooms": int(post.bedrooms),
+        "score": int(post.score),
+    }
+
+
+def build_housing_columns(keys, posts):
+    """Builds a dictionary of `keys` and lists of values from rows selected by `select_housing_content`.
+    Values are formatted as in `build_housing_post`, one column at a time."""
+    columns = dict(zip(keys, map(list, zip(*posts)))) if posts else {key: [] for key in keys}
+    columns["last_updated"] = [format_last_updated(last_updated) for last_updated in columns["last_updated"]]
+    columns["price"] = [f"${price}" for price in columns["price"]]
+    columns["bedrooms"] = list(map(int, columns["bedrooms"]))
+    columns["misc"] = [misc.split(";") for misc in columns["misc"]]
+    columns["score"] = list(map(int, columns["score"]))
+    return columns
+
+
+def format_last_updated(last_updated):
+    """Formats datetime `last_updated` as 'YYYY-MM-DD HH:MM'. Equivalent to `strftime("%Y-%m-%d %H:%M")`,
+    but roughly twice as fast."""
+    return last_updated.isoformat(" ", "minutes")
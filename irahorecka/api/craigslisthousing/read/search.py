@@ -0,0 +1,115 @@
+"""
+/irahorecka/api/craigslisthousing/read/search.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to search Craigslist housing posts by the words of their title and amenities.
+"""
+
+import re
+
+from sqlalchemy import column, false, literal_column, select, table, text
+from sqlalchemy.sql import func
+
+from irahorecka.models import db, CraigslistHousing
+
+# Text search configuration of PostgreSQL - stems English words, e.g. 'charging' --> 'charg'.
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+# FTS5 table indexing the words of posts on SQLite. Its rowid is the post's ID.
+SEARCH_TABLE = table("craigslisthousing_search", column("rowid"), column("title"), column("misc"))
+# Number of posts indexed per batch when backfilling the FTS5 table.
+BACKFILL_BATCH_SIZE = 10_000
+# Maximum number of characters of a search.
+MAX_QUERY_LENGTH = 200
+
+
+def filter_search(query, validated_args):
+    """Filters CraigslistHousing query by the words of `q` in the request args, matched against the title
+    and amenities (`misc`) of posts. Words are stemmed - 'hardwood floors' matches 'Hardwood floor'.
+    PostgreSQL supports web search syntax (quoted phrases, 'or' and '-' to exclude words), other
+    dialects match posts containing every word."""
+    if not validated_args.get("q"):
+        return query
+    if db.engine.dialect.name == "postgresql":
+        return query.filter(get_search_vector().op("@@")(get_search_query(validated_args["q"])))
+    match = get_fts5_query(validated_args["q"])
+    if not match:
+        return query.filter(false())
+    return query.filter(CraigslistHousing.id.in_(select(SEARCH_TABLE.c.rowid).where(fts5_match_predicate(match))))
+
+
+def get_relevance(q):
+    """Returns a SQL expression of the relevance of a post to search `q` - higher is more relevant.
+    Only meaningful for posts matched by `filter_search`."""
+    if db.engine.dialect.name == "postgresql":
+        return func.ts_rank(get_search_vector(), get_search_query(q))
+    # BM25 is only available to queries of the FTS5 table, and lower is more relevant.
+    return (
+        select(-func.bm25(literal_column(SEARCH_TABLE.name)))
+        .where(SEARCH_TABLE.c.rowid == CraigslistHousing.id, fts5_match_predicate(get_fts5_query(q)))
+        .scalar_subquery()
+    )
+
+
+def get_search_vector():
+    """Returns the tsvector of the title and amenities of posts. Matches the expression of the GIN index
+    declared on `CraigslistHousing`."""
+    document = func.coalesce(CraigslistHousing.title, literal_column("''")) + literal_column("' '")
+    return func.to_tsvector(SEARCH_CONFIG, document + func.coalesce(CraigslistHousing.misc, literal_column("''")))
+
+
+def get_search_query(q):
+    """Returns the tsquery of search `q` in web search syntax."""
+    return func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+
+def get_fts5_query(q):
+    """Returns an FTS5 query matching every word of search `q`, or an empty string if `q` has no words.
+    Words are quoted - FTS5 operators and punctuation in `q` are matched as text."""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", q))
+
+
+def fts5_match_predicate(match):
+    """Returns a SQL predicate of rows of the FTS5 table matching FTS5 query `match`."""
+    return literal_column(SEARCH_TABLE.name).op("MATCH")(match)
+
+
+def create_search_index():
+    """Creates the FTS5 table on SQLite and indexes posts missing from it. PostgreSQL searches the GIN
+    index declared on `CraigslistHousing`, which is created with the table's other indexes."""
+    if db.engine.dialect.name != "sqlite":
+        return
+    db.session.execute(
+        text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE.name} USING fts5(title, misc, tokenize='porter')")
+    )
+    indexed = select(SEARCH_TABLE.c.rowid)
+    posts = db.session.execute(
+        select(CraigslistHousing.id, CraigslistHousing.title, CraigslistHousing.misc).where(
+            CraigslistHousing.id.not_in(indexed)
+        )
+    ).all()
+    for i in range(0, len(posts), BACKFILL_BATCH_SIZE):
+        write_search_index([post._asdict() for post in posts[i : i + BACKFILL_BATCH_SIZE]])
+        db.session.commit()
+    db.session.commit()
+
+
+def write_search_index(rows):
+    """Indexes the title and misc of CraigslistHousing `rows` in the FTS5 table on SQLite, replacing
+    their previous entries. Not committed - call within the transaction writing `rows`. PostgreSQL
+    maintains its GIN index as rows are written."""
+    if db.engine.dialect.name != "sqlite" or not rows:
+        return
+    db.session.execute(SEARCH_TABLE.delete().where(SEARCH_TABLE.c.rowid.in_([row["id"] for row in rows])))
+    db.session.execute(
+        SEARCH_TABLE.insert(),
+        [{"rowid": row["id"], "title": row["title"] or "", "misc": row["misc"] or ""} for row in rows],
+    )
+
+
+def prune_search_index():
+    """Removes posts deleted from the CraigslistHousing table (e.g. expired or cleaned) from the FTS5 table
+    on SQLite. Deleted posts are never matched by a search - pruning only keeps the table lean."""
+    if db.engine.dialect.name != "sqlite":
+        return
+    db.session.execute(SEARCH_TABLE.delete().where(SEARCH_TABLE.c.rowid.not_in(select(CraigslistHousing.id))))
+    db.session.commit()
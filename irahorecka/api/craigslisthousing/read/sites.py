@@ -0,0 +1,20 @@
+"""
+/irahorecka/api/craigslisthousing/read/sites.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to read the registry of Craigslist housing sites and areas.
+"""
+
+from pathlib import Path
+
+import yaml
+
+CONFIG_PATH = Path(__file__).absolute().parents[4] / "config.yaml"
+
+
+def read_housing_config(path=CONFIG_PATH):
+    """Returns the `craigslist-housing` section of YAML config at `path` as a dictionary - 'sites' maps
+    Craigslist sites to lists of their areas, 'max-parallel-sites' is the number of sites updated at once."""
+    with open(path) as file:
+        config = yaml.safe_load(file)["craigslist-housing"]
+    return {"max-parallel-sites": config.get("max-parallel-sites", 1), "sites": config["sites"]}
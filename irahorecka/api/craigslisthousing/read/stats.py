@@ -0,0 +1,107 @@
+"""
+/irahorecka/api/craigslisthousing/read/stats.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to handle the validation and delivery of Craigslist housing market statistics from a query.
+"""
+
+import hashlib
+
+from irahorecka import cache
+from irahorecka.api.craigslisthousing.read.validator import RequestArgsValidator
+from irahorecka.api.craigslisthousing.read.vocabulary import read_vocabulary
+from irahorecka.api.craigslisthousing.update.stats import STATS_ATTRS, STATS_GROUPINGS, STATS_PERCENTILES
+from irahorecka.api.version import read_data_version
+from irahorecka.exceptions import ValidationError
+from irahorecka.models import CraigslistHousingMarketStats
+
+REQUEST_ARGS_SCHEMA = {
+    "site": {"type": "string", "required": True},
+    # An empty string (the default) means the attribute is not filtered.
+    "area": {"type": "string", "default": ""},
+    # Comma-separated attributes to group posts by, in any order - normalized to their order in a grouping.
+    "group_by": {
+        "type": "string",
+        "coerce": lambda value: normalize_grouping(value.split(",")),
+        "allowed": [",".join(grouping) for grouping in STATS_GROUPINGS],
+        "default": "",
+    },
+    "neighborhood": {"type": "string", "default": ""},
+    "housing_type": {"type": "string", "allowed": ["", *read_vocabulary()["housing_type"]], "default": ""},
+    "bedrooms": {"type": "float", "coerce": float, "nullable": True, "default": None},
+}
+REQUEST_ARGS_VALIDATOR = RequestArgsValidator(REQUEST_ARGS_SCHEMA)
+# Statistics of a group, in the order they are served.
+STATS_COLUMNS = (
+    "count",
+    *(f"price_{suffix}" for suffix in STATS_PERCENTILES),
+    "ft2_count",
+    *(f"price_per_ft2_{suffix}" for suffix in STATS_PERCENTILES),
+)
+
+
+def read_craigslist_housing_stats(request_args):
+    """ENTRY POINT: Reads query and returns Craigslist housing market statistics as a list of dictionaries,
+    one per group."""
+    return CraigslistHousingStatsPage(request_args).read()
+
+
+class CraigslistHousingStatsPage:
+    """ENTRY POINT: Market statistics of Craigslist housing posts grouped by `group_by`. Validates request
+    args on instantiation and identifies the statistics by a strong ETag and the last refresh of the
+    statistics, without querying them. Statistics are only queried by `read`."""
+
+    def __init__(self, request_args):
+        self.validated_args = parse_request_args(request_args)
+        version, self.last_modified = read_data_version(CraigslistHousingMarketStats.__tablename__)
+        self.key = repr((CraigslistHousingMarketStats.__tablename__, version, sorted(self.validated_args.items())))
+        self.etag = hashlib.sha256(self.key.encode()).hexdigest()
+
+    def read(self):
+        """Returns a list of statistics of every group. Cached until the statistics are next refreshed."""
+        return cache.get_or_set(self.key, lambda: fetch_housing_stats(self.validated_args))
+
+
+def parse_request_args(request_args):
+    """Returns validated and normalized request args. Raises ValidationError if validation fails. Statistics
+    are only materialized per group, so statistics are always grouped by the attributes they are filtered by,
+    e.g. by area on an area's endpoint."""
+    v_status, v_args = REQUEST_ARGS_VALIDATOR.validate(dict(request_args))
+    if not v_status:
+        raise ValidationError(v_args)
+    filtered_attrs = [attr for attr in STATS_ATTRS if v_args[attr] not in ("", None)]
+    grouping = normalize_grouping([*v_args["group_by"].split(","), *filtered_attrs])
+    if grouping not in REQUEST_ARGS_SCHEMA["group_by"]["allowed"]:
+        raise ValidationError({"group_by": [f"unallowed value {grouping} (grouping including filtered attributes)"]})
+    v_args["group_by"] = grouping
+    return v_args
+
+
+def normalize_grouping(attrs):
+    """Returns comma-separated attributes of iterable `attrs` in the order they make up a grouping.
+    Unknown attributes are kept at the end so that validation reports them."""
+    attrs = {attr.strip() for attr in attrs if attr.strip()}
+    known = [attr for attr in STATS_ATTRS if attr in attrs]
+    return ",".join([*known, *sorted(attrs.difference(STATS_ATTRS))])
+
+
+def fetch_housing_stats(validated_args):
+    """Fetches market statistics of groups matching `validated_args` from database. Returns a list of
+    dictionaries of the group's attributes and its statistics."""
+    grouping = [attr for attr in validated_args["group_by"].split(",") if attr]
+    query = CraigslistHousingMarketStats.query.filter(
+        CraigslistHousingMarketStats.site == validated_args["site"],
+        CraigslistHousingMarketStats.grouping == validated_args["group_by"],
+    )
+    for attr in ("area", "housing_type"):
+        if validated_args[attr]:
+            query = query.filter(getattr(CraigslistHousingMarketStats, attr) == validated_args[attr])
+    if validated_args["neighborhood"]:
+        query = query.filter(
+            CraigslistHousingMarketStats.neighborhood.contains(validated_args["neighborhood"], autoescape=True)
+        )
+    if validated_args["bedrooms"] is not None:
+        query = query.filter(CraigslistHousingMarketStats.bedrooms == validated_args["bedrooms"])
+    columns = [getattr(CraigslistHousingMarketStats, column) for column in (*grouping, *STATS_COLUMNS)]
+    query = query.with_entities(*columns).order_by(*(getattr(CraigslistHousingMarketStats, attr) for attr in grouping))
+    return [row._asdict() for row in query]
@@ -0,0 +1,64 @@
+"""
+/irahorecka/api/craigslisthousing/read/validator.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to validate and normalize request args against a Cerberus schema compiled once.
+"""
+
+import threading
+from functools import lru_cache
+
+from cerberus import Validator
+
+# Number of distinct request args whose validation result is kept per schema.
+VALIDATION_CACHE_SIZE = 4096
+
+
+class RequestArgsValidator:
+    """Validates and normalizes request args against Cerberus `schema`. Building a `Validator` checks and
+    expands its schema, which costs more than validating a small request - it's built once per thread
+    instead of once per request. Validators hold the state of the document being validated, so threads
+    don't share one. Results are cached by request args - coercers of `schema` must be pure functions."""
+
+    def __init__(self, schema, cache_size=VALIDATION_CACHE_SIZE):
+        self.schema = schema
+        self._local = threading.local()
+        self._validate_items = lru_cache(maxsize=cache_size)(self._validate_items)
+
+    @property
+    def validator(self):
+        """The calling thread's `Validator`, built on first use."""
+        validator = getattr(self._local, "validator", None)
+        if validator is None:
+            validator = self._local.validator = Validator(self.schema)
+        return validator
+
+    def validate(self, request_args):
+        """Returns a tuple of True and request args normalized (coerced and filled with defaults) if
+        `request_args` are valid, otherwise a tuple of False and Cerberus' errors. Callers may modify
+        the returned dictionary and its lists - they're copies of the cached result."""
+        try:
+            items = tuple(sorted(request_args.items()))
+            hash(items)
+        except TypeError:
+            # Unhashable values (e.g. lists in a JSON body) aren't cached.
+            return self._validate_document(request_args)
+        v_status, v_args = self._validate_items(items)
+        # Lists (e.g. coordinates, or errors of an arg) hold scalars or tuples - a shallow copy of each suffices.
+        return (v_status, {key: list(value) if isinstance(value, list) else value for key, value in v_args.items()})
+
+    def cache_clear(self):
+        """Clears cached validation results."""
+        self._validate_items.cache_clear()
+
+    def _validate_items(self, items):
+        """Validates request args from a sorted tuple of their `items`. Cached on instantiation."""
+        return self._validate_document(dict(items))
+
+    def _validate_document(self, request_args):
+        """Validates and normalizes `request_args` in a single pass - see `validate`."""
+        validator = self.validator
+        if not validator.validate(request_args):
+            return (False, validator.errors)
+        # A new document is normalized on every call - it's not shared with the next caller.
+        return (True, validator.document)
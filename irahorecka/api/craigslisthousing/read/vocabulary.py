@@ -0,0 +1,18 @@
+"""
+/irahorecka/api/craigslisthousing/read/vocabulary.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to handle the interpretation of Craigslist housing enumerated attributes.
+"""
+
+import json
+from pathlib import Path
+
+VOCABULARY_PATH = Path(__file__).absolute().parent.joinpath("vocabulary.json")
+
+
+def read_vocabulary():
+    """Returns `vocabulary.json` as a dictionary of enumerated attributes and their known values."""
+    with open(VOCABULARY_PATH) as file:
+        vocabulary = json.load(file)
+    return vocabulary
@@ -5,121 +5,97 @@
 Module to clean Craigslist housing database table.
 """
 
-import concurrent.futures
 import datetime
 
-# Keep `cchardet` and `lxml` imported - used under the hood
-import cchardet
-import lxml
-import httpx
-from bs4 import BeautifulSoup, SoupStrainer
-from sqlalchemy.sql import func, and_
+from sqlalchemy import case, delete, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import func, and_, or_
 
-from irahorecka.models import db, CraigslistHousing
+from irahorecka.api.version import bump_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingSignature
 
-
-def clean_craigslist_housing():
-    """ENTRY POINT: Cleans Craigslist housing database table. To be ran after every
-    write to database with new Craigslist housing posts."""
-    # Tack on more functions as you see fit. The order of function calls should not be order-dependent.
-    rm_old_posts()
-    rm_duplicate_posts()
-    rm_scam_warning_posts()
-    rm_private_bedrooms_posts()
-    rm_low_price_posts()
-
-
-def rm_old_posts(days=7):
-    """Removes posts where `CraigslistHousing.last_updated` is over `days` days old."""
-    lower_dttm_threshold = datetime.datetime.now() - datetime.timedelta(days=days)
-    CraigslistHousing.query.filter(CraigslistHousing.last_updated < lower_dttm_threshold).delete(
-        synchronize_session="fetch"
-    )
-    db.session.commit()
+# Cleaning rules mapped to functions returning a SQL predicate of posts to remove - see `cleaning_rule`.
+CLEANING_RULES = {}
 
 
-def rm_duplicate_posts():
-    """Filters IDs where `CraigslistHousing._title_neighborhood` is unique. This prevents reposts
-    by users via a different posting ID."""
-    unique_posts = CraigslistHousing.query.with_entities(CraigslistHousing.id).distinct(
-        CraigslistHousing._title_neighborhood
-    )
-    duplicate_posts = CraigslistHousing.__table__.delete().where(CraigslistHousing.id.not_in(unique_posts))
-    # Remove duplicate posts
-    db.session.execute(duplicate_posts)
-    db.session.commit()
-
-
-def rm_scam_warning_posts():
-    """Removes posts where 'scam' is in the post title (case-insensitive). These posts usually warn
-    buyers of scammy Craigslist posts."""
-    CraigslistHousing.query.filter(func.lower(CraigslistHousing.title).contains("scam")).delete(
-        synchronize_session="fetch"
-    )
-    db.session.commit()
-
-
-def rm_private_bedrooms_posts():
-    """Removes housing posts where price / bedrooms <= 600 USD. Studio posts (i.e. bedrooms == 0)
-    are ignored."""
-    posts = CraigslistHousing.query.filter(and_(CraigslistHousing.price > 0, CraigslistHousing.bedrooms > 0))
-    posts.filter(CraigslistHousing.price / CraigslistHousing.bedrooms <= 600).delete(synchronize_session="fetch")
+def clean_craigslist_housing(rules=None, site=None):
+    """ENTRY POINT: Cleans Craigslist housing database table. To be ran after every
+    write to database with new Craigslist housing posts. Removes posts matching any of `rules`
+    (names of registered cleaning rules, default all) with a single DELETE in one transaction.
+    Only posts of `site` are removed if set. Returns a dictionary of the number of posts removed
+    in total and matched per rule - a post may match several rules."""
+    predicates = {name: CLEANING_RULES[name]() for name in (rules or CLEANING_RULES)}
+    if not predicates:
+        return {"total": 0, "rules": {}}
+    where = or_(*predicates.values())
+    if site is not None:
+        where = and_(CraigslistHousing.site == site, where)
+    # Count before deleting - the DELETE only reports the total number of rows removed.
+    matches = db.session.execute(
+        select(*[func.coalesce(func.sum(case((predicate, 1), else_=0)), 0) for predicate in predicates.values()])
+        .select_from(CraigslistHousing)
+        .where(where)
+    ).one()
+    # Nothing is loaded into the session, so there is nothing to synchronize.
+    total = db.session.execute(
+        delete(CraigslistHousing).where(where).execution_options(synchronize_session=False)
+    ).rowcount
     db.session.commit()
+    bump_data_version(CraigslistHousing.__tablename__)
+    return {"total": total, "rules": dict(zip(predicates, matches))}
 
 
-def rm_low_price_posts():
-    """Removes posts where `price` is less than 700 USD."""
-    CraigslistHousing.query.filter(CraigslistHousing.price < 700).delete(synchronize_session="fetch")
-    db.session.commit()
-
+def cleaning_rule(name):
+    """Registers decorated function as cleaning rule `name` of `clean_craigslist_housing`. The function
+    must return a SQL predicate on CraigslistHousing. Rules should not be order-dependent."""
 
-def rm_expired_craigslist_housing():
-    """ENTRY POINT: Removes expired Craigslist housing posts from database. To be ran less
-    frequently than `clean_craigslist_housing` as it is time consuming. Advised to run nightly."""
-    ids = [post.id for post in CraigslistHousing.query.all()]
-    urls = [post.url for post in CraigslistHousing.query.all()]
-    session = httpx.Client()
-    # Must iterables that are equal in length to rows in `CraigslistHousing`.
-    sessions = [session for _ in range(len(urls))]
-    strainer = get_cl_strainer()
-    strainers = [strainer for _ in range(len(urls))]
+    def register(rule):
+        CLEANING_RULES[name] = rule
+        return rule
 
-    args = tuple(zip(ids, urls, sessions, strainers))
-    # Dispatch tasks to multiple threads.
-    for post in map_threads(post_is_expired, args):
-        if post["is_expired"]:
-            CraigslistHousing.query.filter(CraigslistHousing.id == post["id"]).delete(synchronize_session="fetch")
+    return register
 
-    db.session.commit()
 
-
-def post_is_expired(args):
-    """Checks if Craigslist housing post is expired."""
-    id_, url, session, strainer = args
-    soup = BeautifulSoup(session.get(url).text, "lxml", parse_only=strainer)
-    return {
-        "id": id_,
-        "is_expired": bool(
-            soup.find_all("h2")
-            # Searches for keywords 'deleted', 'expired', and 'flagged'.
-            and any(keyword in str(soup.find_all("h2")[0]) for keyword in ("deleted", "expired", "flagged"))
-        ),
-    }
+@cleaning_rule("old")
+def old_posts(days=7):
+    """Matches posts where `CraigslistHousing.last_updated` is over `days` days old."""
+    lower_dttm_threshold = datetime.datetime.now() - datetime.timedelta(days=days)
+    return CraigslistHousing.last_updated < lower_dttm_threshold
+
+
+@cleaning_rule("duplicate")
+def duplicate_posts():
+    """Matches posts that are near duplicates of a newer post still in the table, as detected when posts are
+    written - see `write_duplicate_signatures`. This prevents reposts by users via a different posting ID,
+    including reposts with a changed word or price - only the latest post is kept."""
+    newer_post = aliased(CraigslistHousing)
+    duplicates = (
+        select(CraigslistHousingSignature.post_id)
+        .join(newer_post, newer_post.id == CraigslistHousingSignature.duplicate_of)
+        .where(CraigslistHousingSignature.duplicate_of.isnot(None))
+    )
+    return CraigslistHousing.id.in_(duplicates)
 
 
-def get_cl_strainer():
-    """Gets bs4.SoupStrainer object, targeting relevant elements and attributes of a Craigslist
-    post's HTML document."""
+@cleaning_rule("scam_warning")
+def scam_warning_posts():
+    """Matches posts where 'scam' is in the post title (case-insensitive). These posts usually warn
+    buyers of scammy Craigslist posts."""
+    return func.lower(CraigslistHousing.title).contains("scam")
 
-    def target_elem_attrs(elem, attrs):
-        """Gets desired element and attributes."""
-        return elem == "h2"
 
-    return SoupStrainer(target_elem_attrs)
+@cleaning_rule("private_bedrooms")
+def private_bedrooms_posts():
+    """Matches housing posts where price / bedrooms <= 600 USD. Studio posts (i.e. bedrooms == 0)
+    are ignored."""
+    return and_(
+        CraigslistHousing.price > 0,
+        CraigslistHousing.bedrooms > 0,
+        CraigslistHousing.price / CraigslistHousing.bedrooms <= 600,
+    )
 
 
-def map_threads(func, _iterable):
-    """Maps function with iterable object in using thread pools."""
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        result = executor.map(func, _iterable)
-    return result
+@cleaning_rule("low_price")
+def low_price_posts():
+    """Matches posts where `price` is less than 700 USD."""
+    return CraigslistHousing.price < 700
@@ -0,0 +1,177 @@
+"""
+/irahorecka/api/craigslisthousing/update/expire.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to remove expired Craigslist housing posts from database.
+"""
+
+import asyncio
+import datetime
+import re
+from collections import namedtuple
+
+import httpx
+from sqlalchemy import delete, insert, or_, select
+
+from irahorecka.api.version import bump_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingCheck
+
+try:
+    # Required by `httpx` for HTTP/2.
+    import h2
+except ImportError:
+    h2 = None
+
+# Number of posts checked concurrently.
+EXPIRY_CHECK_CONCURRENCY = 32
+# Keywords in a Craigslist post's first <h2> element if the post was taken down.
+EXPIRED_KEYWORDS = ("deleted", "expired", "flagged")
+# Number of post IDs per DELETE statement - keeps within the database's parameter limits.
+DELETE_CHUNK_SIZE = 1000
+# Bounds of the interval between checks of a post that was live - see `get_next_check_at`.
+MIN_RECHECK_INTERVAL = datetime.timedelta(hours=6)
+MAX_RECHECK_INTERVAL = datetime.timedelta(days=3)
+# Opening and closing tags of a Craigslist post's <h2> elements.
+H2_OPEN_PATTERN = re.compile(r"<h2[\s>]", re.IGNORECASE)
+H2_CLOSE_PATTERN = re.compile(r"</h2>", re.IGNORECASE)
+
+PostCheck = namedtuple("PostCheck", "id is_expired status etag last_modified")
+
+
+def rm_expired_craigslist_housing(concurrency=EXPIRY_CHECK_CONCURRENCY, transport=None):
+    """ENTRY POINT: Removes expired Craigslist housing posts from database. Advised to run nightly.
+    Only posts that are due are checked - see `get_next_check_at`. Returns a dictionary of the number
+    of posts checked and removed. Pass an `httpx.AsyncBaseTransport` as `transport` to check posts
+    against a local stand-in rather than Craigslist."""
+    now = datetime.datetime.now()
+    rm_orphaned_checks()
+    posts = db.session.execute(
+        select(
+            CraigslistHousing.id,
+            CraigslistHousing.url,
+            CraigslistHousing.last_updated,
+            CraigslistHousingCheck.etag,
+            CraigslistHousingCheck.last_modified,
+        )
+        .outerjoin(CraigslistHousingCheck, CraigslistHousingCheck.post_id == CraigslistHousing.id)
+        .where(or_(CraigslistHousingCheck.post_id.is_(None), CraigslistHousingCheck.next_check_at <= now))
+    ).all()
+    checks = asyncio.run(check_posts(posts, concurrency, transport))
+    expired_ids = [check.id for check in checks if check.is_expired]
+    last_updated = {post.id: post.last_updated for post in posts}
+    check_rows = [
+        {
+            "post_id": check.id,
+            "last_checked_at": now,
+            "last_status": check.status,
+            "etag": check.etag,
+            "last_modified": check.last_modified,
+            "next_check_at": get_next_check_at(last_updated[check.id], check.status, now),
+        }
+        for check in checks
+        if not check.is_expired
+    ]
+    for i in range(0, len(checks), DELETE_CHUNK_SIZE):
+        checked_ids = [check.id for check in checks[i : i + DELETE_CHUNK_SIZE]]
+        db.session.execute(
+            delete(CraigslistHousingCheck)
+            .where(CraigslistHousingCheck.post_id.in_(checked_ids))
+            .execution_options(synchronize_session=False)
+        )
+    for i in range(0, len(expired_ids), DELETE_CHUNK_SIZE):
+        db.session.execute(
+            delete(CraigslistHousing)
+            .where(CraigslistHousing.id.in_(expired_ids[i : i + DELETE_CHUNK_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+    if check_rows:
+        db.session.execute(insert(CraigslistHousingCheck), check_rows)
+    # Commit every DELETE and check at once.
+    db.session.commit()
+    if expired_ids:
+        bump_data_version(CraigslistHousing.__tablename__)
+    return {"checked": len(checks), "removed": len(expired_ids)}
+
+
+def rm_orphaned_checks():
+    """Removes checks of posts that are no longer in the CraigslistHousing table, e.g. cleaned posts."""
+    db.session.execute(
+        delete(CraigslistHousingCheck)
+        .where(CraigslistHousingCheck.post_id.not_in(select(CraigslistHousing.id)))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_next_check_at(last_updated, status, now):
+    """Returns when to next check a post that was not expired when checked `now`. A post that couldn't
+    be fetched (`status` None or a server error) is rechecked soon. Otherwise the longer a post has been
+    up, the likelier it is to stay up a while longer - recheck after half its age, within bounds."""
+    if status is None or status >= 500:
+        return now + MIN_RECHECK_INTERVAL
+    age = now - last_updated if last_updated else MAX_RECHECK_INTERVAL
+    return now + min(max(age / 2, MIN_RECHECK_INTERVAL), MAX_RECHECK_INTERVAL)
+
+
+async def check_posts(posts, concurrency=EXPIRY_CHECK_CONCURRENCY, transport=None):
+    """Returns a list of `PostCheck` from an iterable of rows with `id`, `url`, `etag` and `last_modified`
+    attributes. At most `concurrency` posts are checked at once over a shared pool of keep-alive (and
+    HTTP/2, if available) connections."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(http2=h2 is not None, limits=limits, transport=transport) as client:
+
+        async def check(post):
+            async with semaphore:
+                return await check_post(client, post.id, post.url, post.etag, post.last_modified)
+
+        return await asyncio.gather(*(check(post) for post in posts))
+
+
+async def check_post(client, id_, url, etag=None, last_modified=None):
+    """Checks if Craigslist housing post at `url` is expired. The request is conditional on validators
+    `etag` and `last_modified` of the previous check - a 304 response means the post is unchanged and
+    still up. Otherwise the response is read only up to the end of its first <h2> element. Posts that
+    can't be fetched are assumed not to be expired."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            # Keep the previous validators if the response doesn't carry new ones.
+            validators = (response.headers.get("ETag", etag), response.headers.get("Last-Modified", last_modified))
+            if response.status_code == 304:
+                return PostCheck(id_, False, response.status_code, *validators)
+            h2_elem = await read_h2_elem(response)
+            # Searches for keywords 'deleted', 'expired', and 'flagged'.
+            is_expired = h2_elem is not None and any(keyword in h2_elem for keyword in EXPIRED_KEYWORDS)
+            return PostCheck(id_, is_expired, response.status_code, *validators)
+    except httpx.HTTPError:
+        return PostCheck(id_, False, None, etag, last_modified)
+
+
+async def read_h2_elem(response):
+    """Returns the first <h2> element of streamed `response`, reading it only up to the element's end - None
+    if it has none. Each chunk is searched once: text before the opening tag is dropped, and the closing
+    tag is searched for from where the previous search ended."""
+    text = ""
+    # Whether `text` starts at the opening tag, and where to resume searching for the closing tag.
+    is_open = False
+    search_start = 0
+    async for chunk in response.aiter_text():
+        text += chunk
+        if not is_open:
+            h2_open = H2_OPEN_PATTERN.search(text)
+            if h2_open is None:
+                # Keep what may be the start of an opening tag split across chunks.
+                text = text[-len("<h2") :]
+                continue
+            text = text[h2_open.start() :]
+            is_open = True
+        h2_close = H2_CLOSE_PATTERN.search(text, search_start)
+        if h2_close:
+            return text[: h2_close.end()]
+        # The closing tag may be split across chunks.
+        search_start = max(0, len(text) - len("</h2>") + 1)
+    return None
@@ -0,0 +1,100 @@
+"""
+/irahorecka/api/craigslisthousing/update/map.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to cluster Craigslist housing posts into grid cells of map zoom levels.
+"""
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from irahorecka.api.craigslisthousing.read.geo import get_geocell_column, get_geocell_columns, get_geocell_row
+from irahorecka.api.version import bump_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingMapCell
+
+# Map zoom levels with clustered posts. Maps zoomed in further show posts - see `filter_location`.
+MAP_ZOOMS = range(2, 15)
+# Grid cells per side of a map tile, i.e. clusters per 256 pixels.
+MAP_CELLS_PER_TILE = 8
+# Number of cells per INSERT statement - keeps within the database's parameter limits.
+WRITE_CHUNK_SIZE = 10_000
+
+
+def write_craigslist_housing_map(site):
+    """ENTRY POINT: Replaces clusters of Craigslist housing posts of `site` with clusters of every zoom
+    level in `MAP_ZOOMS`. To be ran after posts are written or removed. Returns a dictionary of the number
+    of cells written."""
+    posts = fetch_map_arrays(site)
+    rows = [{"site": site, **row} for zoom in MAP_ZOOMS for row in build_map_cells(posts, zoom)]
+    db.session.execute(
+        delete(CraigslistHousingMapCell)
+        .where(CraigslistHousingMapCell.site == site)
+        .execution_options(synchronize_session=False)
+    )
+    for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+        db.session.execute(insert(CraigslistHousingMapCell), rows[i : i + WRITE_CHUNK_SIZE])
+    db.session.commit()
+    bump_data_version(CraigslistHousingMapCell.__tablename__)
+    return {"cells": len(rows)}
+
+
+def get_map_cell_degrees(zoom):
+    """Returns the size in degrees of grid cells of map `zoom` level - a map tile spans 360 / 2 ** `zoom`
+    degrees of longitude."""
+    return 360 / (2**zoom * MAP_CELLS_PER_TILE)
+
+
+def fetch_map_arrays(site):
+    """Fetches coordinates and prices of posts of `site` with coordinates from database as a dictionary
+    of NumPy arrays. Null or non-positive prices are NaN."""
+    rows = db.session.execute(
+        select(CraigslistHousing.lat, CraigslistHousing.lon, CraigslistHousing.price).where(
+            CraigslistHousing.site == site, CraigslistHousing.geocell.isnot(None)
+        )
+    ).all()
+    lat, lon, price = (np.array(column, dtype=float) for column in zip(*rows)) if rows else (np.empty(0),) * 3
+    price[~(price > 0)] = np.nan
+    return {"lat": lat, "lon": lon, "price": price}
+
+
+def build_map_cells(posts, zoom):
+    """Returns a list of CraigslistHousingMapCell rows as dictionaries, one per grid cell of map `zoom`
+    level with posts (see `fetch_map_arrays`)."""
+    if not posts["lat"].size:
+        return []
+    degrees = get_map_cell_degrees(zoom)
+    cells = get_geocell_row(posts["lat"], degrees) * get_geocell_columns(degrees)
+    cells += get_geocell_column(posts["lon"], degrees)
+    unique_cells, index, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    lat = np.bincount(index, weights=posts["lat"]) / counts
+    lon = np.bincount(index, weights=posts["lon"]) / counts
+    medians = get_group_medians(index, posts["price"], len(unique_cells))
+    return [
+        {
+            "zoom": zoom,
+            "cell": int(cell),
+            "lat": round(float(cell_lat), 5),
+            "lon": round(float(cell_lon), 5),
+            "count": int(count),
+            "price_median": None if np.isnan(median) else float(median),
+        }
+        for cell, cell_lat, cell_lon, count, median in zip(unique_cells, lat, lon, counts, medians)
+    ]
+
+
+def get_group_medians(index, values, n_groups):
+    """Returns an array of the median of `values` of each of `n_groups` groups, where `index` is the group
+    of each value. NaN values are ignored - the median of a group without values is NaN."""
+    has_value = ~np.isnan(values)
+    index, values = index[has_value], values[has_value]
+    # Sort by group, then value - each group's values are contiguous and in order.
+    order = np.lexsort((values, index))
+    index, values = index[order], values[order]
+    counts = np.bincount(index, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    medians = np.full(n_groups, np.nan)
+    grouped = counts > 0
+    low = starts[grouped] + (counts[grouped] - 1) // 2
+    high = starts[grouped] + counts[grouped] // 2
+    medians[grouped] = (values[low] + values[high]) / 2
+    return medians
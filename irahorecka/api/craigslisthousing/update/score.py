@@ -5,40 +5,85 @@
 Module to provide scores to posts in the Craigslist housing database table.
 """
 
-import numpy as np
-from sqlalchemy.sql import func, and_
-
-from irahorecka.models import db, CraigslistHousing
-
+import datetime
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-def write_craigslist_housing_score(site, areas):
+import numpy as np
+from sqlalchemy import bindparam, column, delete, insert, select, update, values, BigInteger, Float
+from sqlalchemy.sql import func
+
+from irahorecka.api.version import bump_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingScored, CraigslistHousingScoreSummary
+
+# Number of posts fetched per batch from a server-side cursor.
+FETCH_BATCH_SIZE = 10_000
+# Number of scores per UPDATE statement - keeps within the database's parameter limits.
+WRITE_CHUNK_SIZE = 10_000
+# Number of processes scoring areas in parallel on a full scoring - areas are scored in process if 1.
+SCORE_PROCESSES = 1
+# Start method of scoring processes. Sites are updated in threads (see `run_site_updates`) - forking a
+# multithreaded process can copy a lock held by another thread and deadlock the child.
+SCORE_START_METHOD = "spawn"
+# Rescore every post once unscored posts would shift a summary's average log(postvalue) by more than
+# this many standard deviations - see `get_drift`.
+SCORE_DRIFT_THRESHOLD = 0.05
+# Groups of posts scored differently, mapped to their normalized score range. Posts with ft2 are more
+# influential than posts without ft2 (scored by bedrooms).
+SCORE_GROUPS = {"ft2": (-100, 100), "bedrooms": (-90, 90)}
+
+LogPostvalueSummary = namedtuple("LogPostvalueSummary", "count avg std")
+
+
+def write_craigslist_housing_score(
+    site, areas, full=False, drift_threshold=SCORE_DRIFT_THRESHOLD, processes=SCORE_PROCESSES
+):
     """ENTRY POINT: Assigns and writes Craigslist housing value scores to posts. Posts
-    without a score are set to 0."""
-    # Build base query after applying preliminary filters.
-    query = preliminary_filter(CraigslistHousing, CraigslistHousing.query)
-    query_site = query.filter(CraigslistHousing.site == site)
-    query_site_ft2 = query_site.filter(CraigslistHousing.ft2 != 0)
-    query_site_sans_ft2 = query_site.filter(CraigslistHousing.ft2 == 0)
-
-    for area in areas:
-        query_area = query_site.filter(CraigslistHousing.area == area)
-        query_area_ft2 = query_site_ft2.filter(CraigslistHousing.area == area)
-        query_area_sans_ft2 = query_site_sans_ft2.filter(CraigslistHousing.area == area)
-
-        # Calculate score for posts with price and ft2.
-        with Ft2(CraigslistHousing, query_site_ft2, query_area_ft2) as ft2:
-            ft2.write_score(query_area_ft2)
-        # Posts with and without filters are scored differently - normalize scores before grouping.
-        normalize_score(CraigslistHousing, query_area_ft2, -100, 100)
-        # Calculate score for posts with price without ft2.
-        with Bedrooms(CraigslistHousing, query_site, query_area) as bedrooms:
-            bedrooms.write_score(query_area_sans_ft2)
-        # Posts without ft2 have scores not as influential as posts with ft2 - set range to -90, 90.
-        normalize_score(CraigslistHousing, query_area_sans_ft2, -90, 90)
-
-    # Set null scores to 0 to maintain constant numeric datatype.
-    query_site.filter(CraigslistHousing.score.is_(None)).update({CraigslistHousing.score: 0})
+    without a score are set to 0. By default only unscored posts (new, or updated since they
+    were scored) are scored, against the summaries of the last full scoring. Every post of `site`
+    is rescored if `full`, if `site` or any of `areas` has no summary yet, or if unscored posts
+    drift from the summaries by more than `drift_threshold` - see `get_drift`. A full scoring scores
+    areas in a pool of `processes` processes. Returns a dictionary of whether every post was rescored
+    and the number of posts scored."""
+    summaries = read_score_summaries(site)
+    if not full and all(area in summaries for area in ("", *areas)):
+        # Posts of other areas are left unscored until their area is scored.
+        query_unscored = CraigslistHousing.query.filter(
+            CraigslistHousing.site == site, CraigslistHousing.area.in_(areas), is_unscored()
+        )
+        preliminary_filter(CraigslistHousing, query_unscored)
+        posts = fetch_housing_arrays(site, areas=areas, unscored=True)
+        # Posts whose value can't be logged are left unscored (NaN), as the database left them null.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if get_drift(posts, summaries, areas) <= drift_threshold:
+                scores = score_unscored_posts(posts, summaries, areas)
+                write_scores(posts["id"], scores)
+                mark_scored(posts)
+                db.session.commit()
+                bump_data_version(CraigslistHousing.__tablename__)
+                return {"full": False, "scored": len(scores)}
+
+    preliminary_filter(CraigslistHousing, CraigslistHousing.query.filter(CraigslistHousing.site == site))
+    posts = fetch_housing_arrays(site)
+    scores, summaries = score_posts(posts, areas, processes)
+    # Posts that could not be scored are NaN - compare as equal to themselves.
+    changed = ~((scores == posts["score"]) | (np.isnan(scores) & np.isnan(posts["score"])))
+    write_scores(posts["id"][changed], scores[changed])
+    write_score_summaries(site, summaries)
+    db.session.execute(
+        delete(CraigslistHousingScored)
+        .where(
+            CraigslistHousingScored.post_id.not_in(select(CraigslistHousing.id).where(CraigslistHousing.site != site))
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # Posts of other areas kept their score - they're scored again once their area is scored.
+    in_areas = np.isin(posts["area"], list(areas))
+    mark_scored({key: value[in_areas] for key, value in posts.items()}, replace=False)
     db.session.commit()
+    bump_data_version(CraigslistHousing.__tablename__)
+    return {"full": True, "scored": len(scores)}
 
 
 def preliminary_filter(model, query):
@@ -49,190 +94,375 @@ def preliminary_filter(model, query):
     return query
 
 
-class Score:
-    """Base class for calculating score of a post."""
-
-    def __init__(self, model, query_site, query_area):
-        # `query_area` must be a child query of `query_site`.
-        self.model = model
-        self.query_site = query_site
-        self.query_area = query_area
-
-    def __enter__(self):
-        """Sets up instance to have queries work with 0.5 bedrooms instead of 0. This is because of
-        the scoring criteria in `_calculate_post_score`, where we work with the logarithmic value of
-        number of bedrooms."""
-        self.query_site.filter(self.model.bedrooms == 0).update({self.model.bedrooms: 0.5})
-        self.query_area.filter(self.model.bedrooms == 0).update({self.model.bedrooms: 0.5})
-        return self
-
-    def __exit__(self, exc_type, exc_value, exc_tb):
-        """Sets queries with 0.5 bedrooms (from `__enter__`) to 0."""
-        self.query_site.filter(self.model.bedrooms == 0.5).update({self.model.bedrooms: 0})
-        self.query_area.filter(self.model.bedrooms == 0.5).update({self.model.bedrooms: 0})
-
-    def _calculate_post_score(self, site_z_score, area_z_score):
-        """Calculates value score for every post. Read description below for calc breakdown:
-        - Gets Z-Scores for posts within a site and area.
-            - Area Z-Score is multiplied with 0.25 coefficient, Site value with 0.65 coefficient.
-        - Score equation:
-            = 0.25 * (1 - (0.25 * z_score_within_area)) + 0.65 * (1 - (0.65 * z_score_within_site)) + 0.1 * (1 + math.log(num_bedrooms)) - 1
-        - Purely average post should equate to a score of 1.0, meaning completely average price within site, area, and has 1 bedroom.
-        - Score more than 0 is GOOD, less than 0 is BAD."""
-        site_weight = 0.25 * (1 - (0.25 * site_z_score))
-        area_weight = 0.65 * (1 - (0.65 * area_z_score))
-        bedroom_weight = 0.1 * (1 + func.log(self.model.bedrooms))
-        # Subtract 1, which is the neutral score.
-        return site_weight + area_weight + bedroom_weight - 1
-
-    @staticmethod
-    def _get_output_within_percentile(fn, *args, perc_min=5, perc_max=95):
-        """Takes lower and upper percentile limit and returns a tuple of lists where the output
-        (i.e. fn(arg1, arg2))) is within the specified percentile range."""
-        output = fn(*args)
-        low = np.percentile(output, perc_min)
-        high = np.percentile(output, perc_max)
-        desired_percentile = np.where(np.logical_and(output >= low, output <= high))
-        return output[desired_percentile]
-
-
-class Ft2(Score):
-    """Calculates score for posts with ft2 attribute. Inherits from `Score`."""
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-    def write_score(self, query_write):
-        """Writes score to posts within `query_write`."""
-        # Filter posts to allow for logarithmic operations.
-        query_write = self._filter_query_for_log_calc(query_write)
-        summary = self._get_log_postvalue_summary()
-        log_postvalue = func.log(
-            self._postvalue_fn(func.log, func.sqrt, self.model.price, self.model.ft2, self.model.bedrooms)
-        )
-        site_z_score = (log_postvalue - summary["site_avg_log_postvalue"]) / summary["site_std_log_postvalue"]
-        area_z_score = (log_postvalue - summary["area_avg_log_postvalue"]) / summary["area_std_log_postvalue"]
-        query_write.update(
-            {self.model.score: self._calculate_post_score(site_z_score, area_z_score)}, synchronize_session="fetch"
-        )
-
-    def _get_log_postvalue_summary(self):
-        """Gets summary average and standard deviation of log(postvalue) for posts in site
-        and area."""
-        postvalue_site = self._get_postvalue_spread(self.query_site)
-        postvalue_area = self._get_postvalue_spread(self.query_area)
-        return {
-            "site_avg_log_postvalue": np.average(np.log(postvalue_site)),
-            "area_avg_log_postvalue": np.average(np.log(postvalue_area)),
-            "site_std_log_postvalue": np.std(np.log(postvalue_site)),
-            "area_std_log_postvalue": np.std(np.log(postvalue_area)),
+def is_unscored():
+    """Returns SQL predicate of posts that are yet to be scored - i.e. were never scored or were updated
+    since. To be used on a query joined with CraigslistHousingScored (see `fetch_housing_arrays`) or with
+    a correlated subquery."""
+    scored = select(CraigslistHousingScored.post_id).where(
+        CraigslistHousingScored.post_id == CraigslistHousing.id,
+        CraigslistHousingScored.last_updated >= CraigslistHousing.last_updated,
+    )
+    return ~scored.exists()
+
+
+def fetch_housing_arrays(site, areas=None, unscored=False):
+    """Fetches posts of `site` from database as a dictionary of NumPy arrays, one per column. Null
+    numerics are NaN. Only fetches posts of `areas` if set, and posts that are yet to be scored if
+    `unscored`. Rows are streamed in batches of `FETCH_BATCH_SIZE` - only the scored columns of each
+    post are kept in memory, never the rows or ORM objects."""
+    query = select(
+        CraigslistHousing.id,
+        CraigslistHousing.area,
+        CraigslistHousing.last_updated,
+        CraigslistHousing.price,
+        CraigslistHousing.ft2,
+        CraigslistHousing.bedrooms,
+        CraigslistHousing.score,
+    ).where(CraigslistHousing.site == site)
+    if areas is not None:
+        query = query.where(CraigslistHousing.area.in_(areas))
+    if unscored:
+        query = query.where(is_unscored())
+    batches = []
+    for rows in db.session.execute(query.execution_options(yield_per=FETCH_BATCH_SIZE)).partitions():
+        batches.append(build_housing_arrays(rows))
+    if not batches:
+        return build_housing_arrays([])
+    # Batches of each column are released as the column is joined - at most a column is held twice.
+    return {key: np.concatenate([batch.pop(key) for batch in batches]) for key in list(batches[0])}
+
+
+def build_housing_arrays(rows):
+    """Builds a dictionary of NumPy arrays, one per column, from rows of `fetch_housing_arrays`."""
+    id_, area, last_updated, price, ft2, bedrooms, score = zip(*rows) if rows else ([],) * 7
+    return {
+        "id": np.array(id_, dtype=np.int64),
+        "area": np.array(area, dtype=object),
+        "last_updated": np.array(last_updated, dtype=object),
+        **{
+            key: np.array(value, dtype=float)
+            for key, value in zip(("price", "ft2", "bedrooms", "score"), (price, ft2, bedrooms, score))
+        },
+    }
+
+
+def get_score_masks(posts):
+    """Returns a tuple of boolean arrays selecting posts with ft2 and without ft2, and an array of posts'
+    bedrooms to score with. Scores work with 0.5 bedrooms instead of 0. This is because of the scoring
+    criteria in `calculate_post_score`, where we work with the logarithmic value of number of bedrooms."""
+    has_ft2 = ~np.isnan(posts["ft2"]) & (posts["ft2"] != 0)
+    sans_ft2 = posts["ft2"] == 0
+    bedrooms = np.where(posts["bedrooms"] == 0, 0.5, posts["bedrooms"])
+    return has_ft2, sans_ft2, bedrooms
+
+
+def score_posts(posts, areas, processes=None):
+    """Returns a tuple of an array of scores of `posts` (see `fetch_housing_arrays`) - one per post -
+    and summaries of the site (keyed by an empty area) and of every area in `areas`. Only posts in
+    `areas` are rescored, every other post keeps its score. Areas are scored in a pool of `processes`
+    processes if more than one."""
+    scores = posts["score"].copy()
+    has_ft2, _, bedrooms = get_score_masks(posts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        site_summary = {
+            "ft2": get_log_postvalue_summary(ft2_postvalues(posts, bedrooms, has_ft2)),
+            "bedrooms": get_log_postvalue_summary(bedrooms_postvalues(posts, bedrooms, np.ones_like(has_ft2))),
         }
+    # Areas are scored independently of each other - only the site summary is shared.
+    in_areas = [posts["area"] == area for area in areas]
+    jobs = (({key: value[in_area] for key, value in posts.items()}, site_summary) for in_area in in_areas)
+    if processes is not None and processes > 1:
+        mp_context = multiprocessing.get_context(SCORE_START_METHOD)
+        with ProcessPoolExecutor(max_workers=processes, mp_context=mp_context) as executor:
+            results = list(executor.map(score_area_posts, *zip(*jobs)))
+    else:
+        results = [score_area_posts(*job) for job in jobs]
+
+    summaries = {"": site_summary}
+    for area, in_area, (area_scores, area_summary) in zip(areas, in_areas, results):
+        scores[in_area] = area_scores
+        summaries[area] = area_summary
+    # Set null scores to 0 to maintain constant numeric datatype.
+    scores[np.isnan(scores)] = 0
+    return scores, summaries
+
+
+def score_area_posts(posts, site_summary):
+    """Returns a tuple of an array of scores of `posts` of an area (see `fetch_housing_arrays`) - one per
+    post - and the area's summary. `site_summary` maps groups (see `SCORE_GROUPS`) to the site's
+    `LogPostvalueSummary`. Safe to run in a worker process."""
+    scores = posts["score"].copy()
+    has_ft2, sans_ft2, bedrooms = get_score_masks(posts)
+    # Posts whose value can't be logged are left unscored (NaN), as the database left them null.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Calculate score for posts with price and ft2.
+        writable = filter_for_ft2_log_calc(posts, has_ft2)
+        area_ft2 = get_log_postvalue_summary(ft2_postvalues(posts, bedrooms, has_ft2))
+        scores[writable] = score_ft2_posts(posts, bedrooms, writable, site_summary["ft2"], area_ft2)
+        # Posts with and without filters are scored differently - normalize scores before grouping.
+        ft2_bounds = normalize_score(scores, has_ft2, *SCORE_GROUPS["ft2"])
+        # Calculate score for posts with price without ft2.
+        writable = filter_for_bedrooms_log_calc(posts, bedrooms, sans_ft2)
+        area_bedrooms = get_log_postvalue_summary(bedrooms_postvalues(posts, bedrooms, np.ones_like(has_ft2)))
+        scores[writable] = score_bedrooms_posts(posts, bedrooms, writable, site_summary["bedrooms"], area_bedrooms)
+        # Posts without ft2 have scores not as influential as posts with ft2 - set range to -90, 90.
+        bedrooms_bounds = normalize_score(scores, sans_ft2, *SCORE_GROUPS["bedrooms"])
+    summary = {"ft2": area_ft2, "bedrooms": area_bedrooms, "ft2_bounds": ft2_bounds, "bedrooms_bounds": bedrooms_bounds}
+    return scores, summary
 
-    def _get_postvalue_spread(self, query):
-        """Takes posts within a percentile range of a post's non-normalized score (algorithm defined in
-        `self._postvalue_fn`) from a given query. This function's intention is to gather the spread
-        of the posts' scores."""
-        # Remove posts where price / ft2 <= 0 and ft2 and price / sqrt(ft2) <= 0.
-        query = self._filter_query_for_log_calc(query)
-        price, ft2, bedrooms = map(
-            lambda x: (np.array(x)), zip(*[(post.price, post.ft2, post.bedrooms) for post in query.all()])
-        )
-        # Gets posts' non-normalized score values (`np.array`) that are within 5% - 95% percentile.
-        return self._get_output_within_percentile(
-            self._postvalue_fn, np.log, np.sqrt, price, ft2, bedrooms, perc_min=5, perc_max=95
-        )
-
-    def _filter_query_for_log_calc(self, query):
-        """Updates query to select for self.model.price / self.model.ft2 > 0 and self.model.price /
-        sqrt(self.model.ft2) > 0 to allow for logarithmic calculations."""
-        return query.filter(
-            and_(
-                self.model.price / func.sqrt(self.model.ft2) > 0,
-                func.log(self.model.price) / func.sqrt(self.model.ft2) > 0,
-            )
-        )
-
-    @staticmethod
-    def _postvalue_fn(log_fn, sqrt_fn, price, ft2, bedrooms):
-        """An algorithm to evaluate housing value from price, ft2, and number of bedrooms."""
-        return log_fn(log_fn(price) / sqrt_fn(bedrooms)) * price / sqrt_fn(ft2)
-
-
-class Bedrooms(Score):
-    """Calculates score for posts without ft2 attribute. Inherits from `Score`."""
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
 
-    def write_score(self, query_write):
-        """Writes score to posts in `query_write`."""
-        # Filter posts to allow for logarithmic operations.
-        query_write = self._filter_query_for_log_calc(query_write)
-        summary = self._get_log_postvalue_summary()
-        log_postvalue = func.log(self._postvalue_fn(func.log, self.model.price, self.model.bedrooms))
-        site_z_score = (log_postvalue - summary["site_avg_log_postvalue"]) / summary["site_std_log_postvalue"]
-        area_z_score = (log_postvalue - summary["area_avg_log_postvalue"]) / summary["area_std_log_postvalue"]
-        query_write.update(
-            {self.model.score: self._calculate_post_score(site_z_score, area_z_score)}, synchronize_session="fetch"
+def score_unscored_posts(posts, summaries, areas):
+    """Returns an array of scores of unscored `posts` (see `fetch_housing_arrays`) against `summaries`
+    of the last full scoring (see `read_score_summaries`) - one per post. Posts are scored and normalized
+    as by `score_posts`, but with the summaries' statistics and percentile bounds."""
+    scores = np.full(len(posts["id"]), np.nan)
+    has_ft2, sans_ft2, bedrooms = get_score_masks(posts)
+    for area in areas:
+        in_area = posts["area"] == area
+        writable = filter_for_ft2_log_calc(posts, in_area & has_ft2)
+        scores[writable] = score_ft2_posts(posts, bedrooms, writable, summaries[""]["ft2"], summaries[area]["ft2"])
+        apply_score_bounds(scores, writable, summaries[area]["ft2_bounds"], *SCORE_GROUPS["ft2"])
+        writable = filter_for_bedrooms_log_calc(posts, bedrooms, in_area & sans_ft2)
+        scores[writable] = score_bedrooms_posts(
+            posts, bedrooms, writable, summaries[""]["bedrooms"], summaries[area]["bedrooms"]
         )
-
-    def _get_log_postvalue_summary(self):
-        """Gets summary average and standard deviation of log(postvalue) for posts in site
-        and area."""
-        postvalue_site = self._get_postvalue_spread(self.query_site)
-        postvalue_area = self._get_postvalue_spread(self.query_area)
-        return {
-            "site_avg_log_postvalue": np.average(np.log(postvalue_site)),
-            "area_avg_log_postvalue": np.average(np.log(postvalue_area)),
-            "site_std_log_postvalue": np.std(np.log(postvalue_site)),
-            "area_std_log_postvalue": np.std(np.log(postvalue_area)),
-        }
-
-    def _get_postvalue_spread(self, query):
-        """Takes posts within a percentile range of a post's non-normalized score (algorithm defined in
-        `self._postvalue_fn`) from a given query. This function's intention is to gather the spread
-        of the posts' scores."""
-        # Filter for bedrooms to be within 0 - 7 range and price > 0.
-        query = self._filter_query_for_log_calc(query)
-        price, bedrooms = map(lambda x: (np.array(x)), zip(*[(post.price, post.bedrooms) for post in query.all()]))
-        # Gets posts' non-normalized score values (`np.array`) that are within 5% - 95% percentile.
-        return self._get_output_within_percentile(self._postvalue_fn, np.log, price, bedrooms, perc_min=5, perc_max=95)
-
-    @staticmethod
-    def _postvalue_fn(log_fn, price, bedrooms):
-        """An algorithm to evaluate housing value from price and number of bedrooms."""
-        return (price + (price * (1 - log_fn(bedrooms)))) / 2
-
-    def _filter_query_for_log_calc(self, query):
-        """Updates query to select for self.model.price and self.model.bedrooms > 0 AND
-        self.model.bedrooms < 8 to allow for logarithmic calculations."""
-        return query.filter(and_(self.model.price > 0, self.model.bedrooms > 0, self.model.bedrooms < 8))
-
-
-def normalize_score(model, query, min_score, max_score):
-    """Normalizes score to fall within `min_score` and `max_score`."""
-    # Update all model.score value with NoneType to be the average of min and max normalized scores.
-    query.filter(model.score == 0).update({model.score: (min_score + max_score) / 2})
-    # Get query with all numtypes in model.score.
-    query_num = query.filter(model.score != 0)
-    min_q_score, max_q_score = get_min_max_scores(query_num)
-    query_num.filter(model.score <= min_q_score).update({model.score: min_score})
-    query_num.filter(model.score >= max_q_score).update({model.score: max_score})
-
-    # Get query with model.score within min_q_score and max_q_score.
-    query_range = query_num.filter(and_(model.score >= min_q_score, model.score <= max_q_score))
+        apply_score_bounds(scores, writable, summaries[area]["bedrooms_bounds"], *SCORE_GROUPS["bedrooms"])
+    # Set null scores to 0 to maintain constant numeric datatype.
+    scores[np.isnan(scores)] = 0
+    return scores
+
+
+def get_drift(posts, summaries, areas):
+    """Returns how far unscored `posts` would shift the summaries' average log(postvalue) if they were
+    summarized along with the posts of the last full scoring, in standard deviations - the maximum over
+    the site's and `areas`' summaries of posts with and without ft2. Infinite if a summary has no spread."""
+    has_ft2, _, bedrooms = get_score_masks(posts)
+    drift = 0.0
+    for area in ("", *areas):
+        in_area = posts["area"] == area if area else np.ones_like(has_ft2)
+        for group, postvalue in (
+            ("ft2", ft2_postvalues(posts, bedrooms, in_area & has_ft2)),
+            ("bedrooms", bedrooms_postvalues(posts, bedrooms, in_area)),
+        ):
+            log_postvalue = np.log(postvalue)
+            log_postvalue = log_postvalue[np.isfinite(log_postvalue)]
+            if not log_postvalue.size:
+                continue
+            summary = summaries[area][group]
+            if not summary.std > 0:
+                return np.inf
+            share = log_postvalue.size / (summary.count + log_postvalue.size)
+            drift = max(drift, share * abs(np.average(log_postvalue) - summary.avg) / summary.std)
+    return drift
+
+
+def score_ft2_posts(posts, bedrooms, mask, site_summary, area_summary):
+    """Returns raw scores of posts with ft2 selected by `mask`."""
+    price, ft2, post_bedrooms = posts["price"][mask], posts["ft2"][mask], bedrooms[mask]
+    log_postvalue = np.log10(ft2_postvalue_fn(np.log10, np.sqrt, price, ft2, post_bedrooms))
+    return calculate_post_score(log_postvalue, site_summary, area_summary, post_bedrooms)
+
+
+def score_bedrooms_posts(posts, bedrooms, mask, site_summary, area_summary):
+    """Returns raw scores of posts without ft2 selected by `mask`."""
+    price, post_bedrooms = posts["price"][mask], bedrooms[mask]
+    log_postvalue = np.log10(bedrooms_postvalue_fn(np.log10, price, post_bedrooms))
+    return calculate_post_score(log_postvalue, site_summary, area_summary, post_bedrooms)
+
+
+def calculate_post_score(log_postvalue, site_summary, area_summary, bedrooms):
+    """Calculates value score for every post. Read description below for calc breakdown:
+    - Gets Z-Scores for posts within a site and area.
+        - Area Z-Score is multiplied with 0.25 coefficient, Site value with 0.65 coefficient.
+    - Score equation:
+        = 0.25 * (1 - (0.25 * z_score_within_area)) + 0.65 * (1 - (0.65 * z_score_within_site)) + 0.1 * (1 + math.log(num_bedrooms)) - 1
+    - Purely average post should equate to a score of 1.0, meaning completely average price within site, area, and has 1 bedroom.
+    - Score more than 0 is GOOD, less than 0 is BAD.
+    Summaries are `LogPostvalueSummary` of log(postvalue). Scores use base 10 logarithms (the database's
+    `log`, which scored posts before they were scored in memory) while summaries use natural logarithms
+    - kept as is so scores don't change."""
+    site_z_score = (log_postvalue - site_summary.avg) / site_summary.std
+    area_z_score = (log_postvalue - area_summary.avg) / area_summary.std
+    site_weight = 0.25 * (1 - (0.25 * site_z_score))
+    area_weight = 0.65 * (1 - (0.65 * area_z_score))
+    bedroom_weight = 0.1 * (1 + np.log10(bedrooms))
+    # Subtract 1, which is the neutral score.
+    return site_weight + area_weight + bedroom_weight - 1
+
+
+def get_log_postvalue_summary(postvalue):
+    """Gets `LogPostvalueSummary` - the number of posts, and average and standard deviation of
+    log(postvalue) for posts within a percentile range of their `postvalue` (see `ft2_postvalues`)."""
+    if not postvalue.size:
+        return LogPostvalueSummary(0, np.nan, np.nan)
+    log_postvalue = np.log(get_output_within_percentile(postvalue, perc_min=5, perc_max=95))
+    return LogPostvalueSummary(postvalue.size, np.average(log_postvalue), np.std(log_postvalue))
+
+
+def get_output_within_percentile(output, perc_min=5, perc_max=95):
+    """Takes lower and upper percentile limit and returns values of array `output` that are within
+    the specified percentile range."""
+    low, high = np.percentile(output, (perc_min, perc_max))
+    return output[(output >= low) & (output <= high)]
+
+
+def ft2_postvalues(posts, bedrooms, mask):
+    """Returns postvalues of posts with ft2 selected by `mask`, with natural logarithms."""
+    mask = filter_for_ft2_log_calc(posts, mask)
+    return ft2_postvalue_fn(np.log, np.sqrt, posts["price"][mask], posts["ft2"][mask], bedrooms[mask])
+
+
+def bedrooms_postvalues(posts, bedrooms, mask):
+    """Returns postvalues of posts selected by `mask`, with natural logarithms."""
+    mask = filter_for_bedrooms_log_calc(posts, bedrooms, mask)
+    return bedrooms_postvalue_fn(np.log, posts["price"][mask], bedrooms[mask])
+
+
+def filter_for_ft2_log_calc(posts, mask):
+    """Narrows boolean array `mask` to posts where price / sqrt(ft2) > 0 and log(price) / sqrt(ft2) > 0
+    to allow for logarithmic calculations."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_ft2 = np.sqrt(posts["ft2"])
+        return mask & (posts["price"] / sqrt_ft2 > 0) & (np.log10(posts["price"]) / sqrt_ft2 > 0)
+
+
+def filter_for_bedrooms_log_calc(posts, bedrooms, mask):
+    """Narrows boolean array `mask` to posts where price and bedrooms > 0 AND bedrooms < 8 to allow
+    for logarithmic calculations."""
+    return mask & (posts["price"] > 0) & (bedrooms > 0) & (bedrooms < 8)
+
+
+def ft2_postvalue_fn(log_fn, sqrt_fn, price, ft2, bedrooms):
+    """An algorithm to evaluate housing value from price, ft2, and number of bedrooms."""
+    return log_fn(log_fn(price) / sqrt_fn(bedrooms)) * price / sqrt_fn(ft2)
+
+
+def bedrooms_postvalue_fn(log_fn, price, bedrooms):
+    """An algorithm to evaluate housing value from price and number of bedrooms."""
+    return (price + (price * (1 - log_fn(bedrooms)))) / 2
+
+
+def normalize_score(scores, mask, min_score, max_score):
+    """Normalizes scores of posts selected by boolean array `mask` to fall within `min_score` and
+    `max_score`, in place. Returns a tuple of the percentile bounds of raw scores mapped to `min_score`
+    and `max_score` - None if no post has a score."""
+    # Posts scored exactly 0 are set to the average of min and max normalized scores.
+    scores[mask & (scores == 0)] = (min_score + max_score) / 2
+    # Get posts with numeric, non-zero scores.
+    mask_num = mask & ~np.isnan(scores) & (scores != 0)
+    if not mask_num.any():
+        return None
+    bounds = get_min_max_scores(scores[mask_num])
+    apply_score_bounds(scores, mask_num, bounds, min_score, max_score)
+    return bounds
+
+
+def apply_score_bounds(scores, mask, bounds, min_score, max_score):
+    """Normalizes numeric scores of posts selected by boolean array `mask` in place, mapping raw score
+    `bounds` (see `get_min_max_scores`) to `min_score` and `max_score`. Scores are left as they are
+    if `bounds` is None."""
+    if bounds is None:
+        return
+    min_q_score, max_q_score = bounds
+    # Each step applies to scores as updated by the previous step.
+    scores[mask & (scores <= min_q_score)] = min_score
+    scores[mask & (scores >= max_q_score)] = max_score
+    mask_range = mask & (scores >= min_q_score) & (scores <= max_q_score)
     # Equation for normalizing score:
     # (((score - low_score) / (high_score - low_score)) * (2 * max_score)) + min_score
-    normalized_score = ((model.score - min_q_score) / (max_q_score - min_q_score)) * (2 * max_score) + min_score
+    normalized_score = ((scores[mask_range] - min_q_score) / (max_q_score - min_q_score)) * (2 * max_score) + min_score
     # Round normalized score to the nearest 5.
-    query_range.update({model.score: func.round(normalized_score * 0.2) / 0.2})
+    scores[mask_range] = np.round(normalized_score * 0.2) / 0.2
 
 
-def get_min_max_scores(query):
+def get_min_max_scores(scores):
     """To be called after binding scores to posts. Normalizes score to more user friendly values.
-    See `normalize_score`. Input query where query.score is all numerics."""
-    scores = np.array([post.score for post in query.all()])
+    See `normalize_score`. Input an array of numeric scores."""
     # Takes scores within 0.75% to 99.25% percentile - sets these as absolute min and max, respectively.
     low = np.percentile(scores, 0.75)
     high = np.percentile(scores, 99.25)
     return low, high
+
+
+def write_scores(ids, scores):
+    """Writes `scores` to posts of `ids` in bulk. PostgreSQL updates from a VALUES list, one statement
+    per `WRITE_CHUNK_SIZE` posts - other dialects update by primary key in batches."""
+    rows = [{"id": int(id_), "score": float(score)} for id_, score in zip(ids, scores)]
+    for i in range(0, len(rows), WRITE_CHUNK_SIZE):
+        chunk = rows[i : i + WRITE_CHUNK_SIZE]
+        if db.engine.dialect.name == "postgresql":
+            scores_values = values(column("id", BigInteger), column("score", Float), name="scores").data(
+                [(row["id"], row["score"]) for row in chunk]
+            )
+            db.session.execute(
+                update(CraigslistHousing)
+                .where(CraigslistHousing.id == scores_values.c.id)
+                .values(score=scores_values.c.score)
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            db.session.execute(
+                update(CraigslistHousing.__table__).where(CraigslistHousing.id == bindparam("post_id")),
+                [{"post_id": row["id"], "score": row["score"]} for row in chunk],
+            )
+
+
+def mark_scored(posts, replace=True):
+    """Records `posts` (see `fetch_housing_arrays`) as scored as of their `last_updated`. Replaces
+    previous records of the posts if `replace` - otherwise they must have been removed."""
+    ids = [int(id_) for id_ in posts["id"]]
+    if replace:
+        for i in range(0, len(ids), WRITE_CHUNK_SIZE):
+            db.session.execute(
+                delete(CraigslistHousingScored)
+                .where(CraigslistHousingScored.post_id.in_(ids[i : i + WRITE_CHUNK_SIZE]))
+                .execution_options(synchronize_session=False)
+            )
+    rows = [{"post_id": id_, "last_updated": last_updated} for id_, last_updated in zip(ids, posts["last_updated"])]
+    if rows:
+        db.session.execute(insert(CraigslistHousingScored), rows)
+
+
+def read_score_summaries(site):
+    """Returns summaries of the last full scoring of `site` as a dictionary keyed by area - an empty
+    area summarizes the whole site. Each summary maps groups (see `SCORE_GROUPS`) to `LogPostvalueSummary`
+    and '<group>_bounds' to percentile bounds of raw scores."""
+    summaries = {}
+    for row in CraigslistHousingScoreSummary.query.filter(CraigslistHousingScoreSummary.site == site):
+        summaries[row.area] = {}
+        for group in SCORE_GROUPS:
+            summaries[row.area][group] = LogPostvalueSummary(
+                getattr(row, f"{group}_count"),
+                to_float(getattr(row, f"{group}_avg_log_postvalue")),
+                to_float(getattr(row, f"{group}_std_log_postvalue")),
+            )
+            min_q_score, max_q_score = getattr(row, f"{group}_min_score"), getattr(row, f"{group}_max_score")
+            summaries[row.area][f"{group}_bounds"] = None if min_q_score is None else (min_q_score, max_q_score)
+    return summaries
+
+
+def write_score_summaries(site, summaries):
+    """Replaces summaries of `site` in database with `summaries` (see `read_score_summaries`)."""
+    CraigslistHousingScoreSummary.query.filter(CraigslistHousingScoreSummary.site == site).delete()
+    computed_at = datetime.datetime.utcnow()
+    for area, summary in summaries.items():
+        row = CraigslistHousingScoreSummary(site=site, area=area, computed_at=computed_at)
+        for group in SCORE_GROUPS:
+            setattr(row, f"{group}_count", summary[group].count)
+            setattr(row, f"{group}_avg_log_postvalue", to_nullable(summary[group].avg))
+            setattr(row, f"{group}_std_log_postvalue", to_nullable(summary[group].std))
+            bounds = summary.get(f"{group}_bounds")
+            if bounds is not None:
+                setattr(row, f"{group}_min_score", float(bounds[0]))
+                setattr(row, f"{group}_max_score", float(bounds[1]))
+        db.session.add(row)
+
+
+def to_nullable(value):
+    """Returns float `value`, or None if NaN - not every database stores NaN."""
+    return None if np.isnan(value) else float(value)
+
+
+def to_float(value):
+    """Returns nullable `value` as a float - NaN if None."""
+    return np.nan if value is None else value
@@ -0,0 +1,105 @@
+"""
+/irahorecka/api/craigslisthousing/update/stats.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to materialize market statistics of Craigslist housing posts.
+"""
+
+import datetime
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from irahorecka.api.version import bump_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingMarketStats
+
+# Attributes posts may be grouped by, in the order they make up a grouping.
+STATS_ATTRS = ("area", "neighborhood", "bedrooms", "housing_type")
+# Groupings of posts with materialized statistics. Neighborhoods are only unique within an area.
+STATS_GROUPINGS = (
+    (),
+    ("area",),
+    ("area", "neighborhood"),
+    ("area", "bedrooms"),
+    ("area", "housing_type"),
+    ("area", "neighborhood", "bedrooms"),
+    ("area", "bedrooms", "housing_type"),
+    ("bedrooms",),
+    ("housing_type",),
+    ("bedrooms", "housing_type"),
+)
+# Percentiles of price and price per ft2, mapped to the suffix of their column.
+STATS_PERCENTILES = {"p25": 25, "median": 50, "p75": 75}
+# Number of posts fetched per batch from a server-side cursor.
+FETCH_BATCH_SIZE = 10_000
+
+
+def write_craigslist_housing_stats(site):
+    """ENTRY POINT: Replaces market statistics of Craigslist housing posts of `site` with statistics
+    of every grouping in `STATS_GROUPINGS`. To be ran after posts are scored. Returns a dictionary of
+    the number of groups written."""
+    posts = fetch_stats_arrays(site)
+    computed_at = datetime.datetime.utcnow()
+    rows = [
+        {"site": site, "computed_at": computed_at, **row}
+        for grouping in STATS_GROUPINGS
+        for row in build_stats_rows(posts, grouping)
+    ]
+    db.session.execute(
+        delete(CraigslistHousingMarketStats)
+        .where(CraigslistHousingMarketStats.site == site)
+        .execution_options(synchronize_session=False)
+    )
+    if rows:
+        db.session.execute(insert(CraigslistHousingMarketStats), rows)
+    db.session.commit()
+    bump_data_version(CraigslistHousingMarketStats.__tablename__)
+    return {"groups": len(rows)}
+
+
+def fetch_stats_arrays(site):
+    """Fetches posts of `site` with a price from database as a dictionary of NumPy arrays, one per
+    attribute in `STATS_ATTRS` and 'price' and 'ft2'. Null ft2 is NaN."""
+    query = select(*(getattr(CraigslistHousing, attr) for attr in (*STATS_ATTRS, "price", "ft2"))).where(
+        CraigslistHousing.site == site, CraigslistHousing.price > 0
+    )
+    columns = defaultdict(list)
+    for rows in db.session.execute(query.execution_options(yield_per=FETCH_BATCH_SIZE)).partitions():
+        for attr, values in zip((*STATS_ATTRS, "price", "ft2"), zip(*rows)):
+            columns[attr].extend(values)
+    return {
+        **{attr: np.array(columns[attr], dtype=object) for attr in STATS_ATTRS},
+        "price": np.array(columns["price"], dtype=float),
+        "ft2": np.array(columns["ft2"], dtype=float),
+    }
+
+
+def build_stats_rows(posts, grouping):
+    """Yields a CraigslistHousingMarketStats row as a dictionary for every group of `posts` (see
+    `fetch_stats_arrays`) by the attributes in `grouping`."""
+    keys = zip(*(posts[attr] for attr in grouping)) if grouping else [()] * len(posts["price"])
+    groups = defaultdict(list)
+    for i, key in enumerate(keys):
+        groups[key].append(i)
+    for key, index in groups.items():
+        price, ft2 = posts["price"][index], posts["ft2"][index]
+        has_ft2 = ft2 > 0
+        yield {
+            "grouping": ",".join(grouping),
+            # Attributes posts aren't grouped by are null - every row has the same keys for a bulk insert.
+            **{attr: None for attr in STATS_ATTRS},
+            **dict(zip(grouping, key)),
+            "count": len(price),
+            **get_percentiles("price", price),
+            "ft2_count": int(has_ft2.sum()),
+            **get_percentiles("price_per_ft2", price[has_ft2] / ft2[has_ft2]),
+        }
+
+
+def get_percentiles(name, values):
+    """Returns a dictionary of `STATS_PERCENTILES` of array `values`, keyed by column - None if empty."""
+    if not values.size:
+        return {f"{name}_{suffix}": None for suffix in STATS_PERCENTILES}
+    percentiles = np.percentile(values, list(STATS_PERCENTILES.values()))
+    return {f"{name}_{suffix}": round(float(value), 2) for suffix, value in zip(STATS_PERCENTILES, percentiles)}
@@ -0,0 +1,185 @@
+"""
+/irahorecka/api/craigslisthousing/write/duplicate.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to detect near-duplicate Craigslist housing posts (e.g. reposts with a changed word or price) as
+they are written, using MinHash signatures and locality-sensitive hashing (LSH).
+"""
+
+import hashlib
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import bindparam, delete, exists, insert, or_, select, update
+
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingBucket, CraigslistHousingSignature
+
+# Minimum estimated Jaccard similarity of the shingles of two posts for the older post to be a duplicate.
+DUPLICATE_THRESHOLD = 0.7
+# Number of characters per shingle of a post's neighborhood and title.
+SHINGLE_SIZE = 4
+# Number of hash functions of a MinHash signature, split into `LSH_BANDS` bands of consecutive values.
+# Posts sharing a band are candidates - with 20 bands of 5 values, posts with a similarity of 0.7 are
+# candidates 97.5% of the time, and 0.8 over 99.9%. Lower thresholds lose recall, e.g. 47% at 0.5.
+MINHASH_PERMUTATIONS = 100
+LSH_BANDS = 20
+# Largest prime below 2 ** 32 - hash functions are (a * x + b) mod `MINHASH_PRIME` of 32-bit shingle hashes.
+MINHASH_PRIME = 4_294_967_291
+# Seed of the hash functions' coefficients. Changing it invalidates every stored signature.
+MINHASH_SEED = 20_211_017
+MINHASH_A, MINHASH_B = np.random.default_rng(MINHASH_SEED).integers(
+    1, MINHASH_PRIME, size=(2, MINHASH_PERMUTATIONS, 1), dtype=np.uint64
+)
+
+
+def write_duplicate_signatures(rows, threshold=DUPLICATE_THRESHOLD):
+    """Signs CraigslistHousing `rows` and indexes them in LSH buckets, replacing previous signatures. Each
+    post is compared only with the posts sharing one of its buckets - posts of the same site and bedrooms
+    with similar text - and of a pair of near duplicates, the older post is marked a duplicate of the newer
+    one (see the 'duplicate' cleaning rule). Not committed - call within the transaction writing `rows`.
+    Returns the number of posts newly marked a duplicate - posts already marked a duplicate of an older
+    post and pointed to a newer one aren't counted again."""
+    rows = {row["id"]: row for row in rows}
+    signatures = {}
+    for post_id, row in rows.items():
+        signature = get_minhash_signature(get_shingles(row))
+        if signature is not None:
+            signatures[post_id] = signature
+    buckets = {
+        post_id: get_lsh_buckets(rows[post_id]["site"], rows[post_id]["bedrooms"], signature)
+        for post_id, signature in signatures.items()
+    }
+    marked = read_marked_duplicates(list(rows))
+    db.session.execute(delete(CraigslistHousingSignature).where(CraigslistHousingSignature.post_id.in_(rows)))
+    db.session.execute(delete(CraigslistHousingBucket).where(CraigslistHousingBucket.post_id.in_(rows)))
+    duplicate_of = find_duplicates(signatures, buckets, threshold)
+    superseded_ids = [post_id for post_id in duplicate_of if post_id not in signatures]
+    marked |= read_marked_duplicates(superseded_ids)
+    if signatures:
+        db.session.execute(
+            insert(CraigslistHousingSignature),
+            [
+                {"post_id": post_id, "signature": signature.tobytes(), "duplicate_of": duplicate_of.get(post_id)}
+                for post_id, signature in signatures.items()
+            ],
+        )
+        db.session.execute(
+            insert(CraigslistHousingBucket),
+            [{"bucket": bucket, "post_id": post_id} for post_id in buckets for bucket in buckets[post_id]],
+        )
+    # Previously written posts superseded by `rows` - a post only ever points to a newer post.
+    superseded = [{"older_id": older_id, "newer_id": duplicate_of[older_id]} for older_id in superseded_ids]
+    if superseded:
+        db.session.execute(
+            update(CraigslistHousingSignature.__table__)
+            .where(
+                CraigslistHousingSignature.post_id == bindparam("older_id"),
+                or_(
+                    CraigslistHousingSignature.duplicate_of.is_(None),
+                    CraigslistHousingSignature.duplicate_of < bindparam("newer_id"),
+                ),
+            )
+            .values(duplicate_of=bindparam("newer_id")),
+            superseded,
+        )
+    return len(duplicate_of.keys() - marked)
+
+
+def read_marked_duplicates(post_ids):
+    """Returns a set of the IDs of posts of `post_ids` already marked a duplicate of another post."""
+    if not post_ids:
+        return set()
+    return set(
+        db.session.scalars(
+            select(CraigslistHousingSignature.post_id).where(
+                CraigslistHousingSignature.post_id.in_(post_ids), CraigslistHousingSignature.duplicate_of.is_not(None)
+            )
+        )
+    )
+
+
+def find_duplicates(signatures, buckets, threshold=DUPLICATE_THRESHOLD):
+    """Returns a dictionary of post IDs mapped to the ID of the newest post they're a near duplicate of, given
+    dictionaries of `signatures` and `buckets` of posts being written. Candidates are the posts being written
+    and previously written posts sharing a bucket. Pairs are confirmed by the fraction of equal signature
+    values, an estimate of the Jaccard similarity of their shingles, of at least `threshold`."""
+    bucket_posts = defaultdict(set)
+    keys = {bucket for post_buckets in buckets.values() for bucket in post_buckets}
+    if keys:
+        for bucket, post_id in db.session.execute(
+            select(CraigslistHousingBucket.bucket, CraigslistHousingBucket.post_id).where(
+                CraigslistHousingBucket.bucket.in_(keys)
+            )
+        ):
+            bucket_posts[bucket].add(post_id)
+    for post_id, post_buckets in buckets.items():
+        for bucket in post_buckets:
+            bucket_posts[bucket].add(post_id)
+    candidates = {
+        post_id: set().union(*(bucket_posts[bucket] for bucket in post_buckets)) - {post_id}
+        for post_id, post_buckets in buckets.items()
+    }
+    candidate_signatures = dict(signatures)
+    written_ids = set().union(*candidates.values()) - signatures.keys()
+    if written_ids:
+        for post_id, signature in db.session.execute(
+            select(CraigslistHousingSignature.post_id, CraigslistHousingSignature.signature).where(
+                CraigslistHousingSignature.post_id.in_(written_ids)
+            )
+        ):
+            candidate_signatures[post_id] = np.frombuffer(signature, dtype=np.uint32)
+    duplicate_of = {}
+    for post_id, candidate_ids in candidates.items():
+        for candidate_id in candidate_ids:
+            if candidate_id not in candidate_signatures:
+                continue
+            similarity = np.mean(signatures[post_id] == candidate_signatures[candidate_id])
+            if similarity >= threshold:
+                older_id, newer_id = sorted((post_id, candidate_id))
+                duplicate_of[older_id] = max(duplicate_of.get(older_id, newer_id), newer_id)
+    return duplicate_of
+
+
+def get_shingles(row):
+    """Returns the set of `SHINGLE_SIZE`-character shingles of a post's neighborhood and title, lowercased
+    with punctuation and whitespace collapsed to a single space."""
+    text = re.sub(r"\W+", " ", f"{row['neighborhood'] or ''} {row['title'] or ''}".lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def get_minhash_signature(shingles):
+    """Returns the MinHash signature of set `shingles` as an array of `MINHASH_PERMUTATIONS` unsigned 32-bit
+    integers - the minimum of each hash function over the shingles. None if there are no shingles."""
+    if not shingles:
+        return None
+    hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles], dtype=np.uint64)
+    # Coefficients and hashes are below 2 ** 32 - products fit in 64 bits.
+    return ((MINHASH_A * hashes + MINHASH_B) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+
+def get_lsh_buckets(site, bedrooms, signature):
+    """Returns a list of the signed 64-bit IDs of the LSH bucket of every band of `signature`. Buckets are
+    specific to `site` and `bedrooms` - posts of different units are never candidates."""
+    prefix = f"{site}:{float(bedrooms or 0)}:".encode()
+    return [
+        int.from_bytes(
+            hashlib.blake2b(prefix + bytes([band]) + values.tobytes(), digest_size=8).digest(), "big", signed=True
+        )
+        for band, values in enumerate(np.split(signature, LSH_BANDS))
+    ]
+
+
+def prune_duplicate_signatures():
+    """Removes signatures and buckets of posts deleted from the CraigslistHousing table (e.g. expired or
+    cleaned), so that posts aren't compared with them."""
+    for model in (CraigslistHousingSignature, CraigslistHousingBucket):
+        db.session.execute(
+            delete(model)
+            .where(~exists().where(CraigslistHousing.id == model.post_id))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
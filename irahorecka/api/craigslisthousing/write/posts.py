@@ -5,98 +5,208 @@
 Module to write and update Craigslist housing database table.
 """
 
-import time
 from datetime import datetime
 
-import pycraigslist
-from pycraigslist.exceptions import HTTPError
-from sqlalchemy import exc
+from sqlalchemy import exc, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 
+from irahorecka.api.craigslisthousing.read.geo import get_geocell
+from irahorecka.api.craigslisthousing.read.search import prune_search_index, write_search_index
+from irahorecka.api.craigslisthousing.write.duplicate import (
+    prune_duplicate_signatures,
+    write_duplicate_signatures,
+    DUPLICATE_THRESHOLD,
+)
+from irahorecka.api.craigslisthousing.write.scrape import ApaScraper, ScrapeProgress
+from irahorecka.api.version import bump_data_version
+from irahorecka.exceptions import ScrapeError
 from irahorecka.models import db, CraigslistHousing
 
+# Number of posts written to database per transaction.
+WRITE_CHUNK_SIZE = 500
 
-def write_craigslist_housing(site, areas=("null",)):
-    """ENTRY POINT: Writes Craigslist housing posts (category `apa`) to database."""
-    craigslist_housing = fetch_craigslist_apa(site, areas)
-    posts = [
-        CraigslistHousing(
-            id=post["id"],
-            site=post.get("site", ""),
-            area=post.get("area", "0"),
-            repost_of=post.get("repost_of", ""),
-            last_updated=datetime.strptime(post["last_updated"], "%Y-%m-%d %H:%M"),
-            title=post.get("title", ""),
-            neighborhood=post.get("neighborhood", "").lower(),
-            address=post.get("address", ""),
-            # Coordinates for Guest Peninsula, Antactica if there's no lat or lon.
-            lat="-76.299965" if not post.get("lat") else post["lat"],
-            lon="-148.003021" if not post.get("lon") else post["lon"],
-            # Convert price into numerics: e.g. '$1,500' --> '1500'
-            price=post.get("price", "0").replace("$", "").replace(",", ""),
-            housing_type=post.get("housing_type", ""),
-            bedrooms=post.get("bedrooms", "0"),
-            flooring=post.get("flooring", ""),
-            is_furnished=bool(post.get("is_furnished")),
-            no_smoking=bool(post.get("no_smoking", "false")),
-            ft2=post.get("area-ft2", "0"),
-            laundry=post.get("laundry", ""),
-            parking=post.get("parking", ""),
-            rent_period=post.get("rent_period", ""),
-            url=post.get("url", ""),
-            misc=";".join(post.get("misc", [])),
-            _title_neighborhood=f'{post.get("neighborhood", "")}{post.get("title", "")}',
-        )
-        for post in craigslist_housing
-    ]
-    try:
-        db.session.add_all(posts)
-        db.session.commit()
-    except exc.IntegrityError:
-        db.session.rollback()
-
-
-def fetch_craigslist_apa(*args, **kwargs):
-    """Fetches Craigslist apartments / housing posts."""
-    posts = []
+
+def write_craigslist_housing(
+    site, areas=("null",), chunk_size=WRITE_CHUNK_SIZE, progress_path=None, duplicate_threshold=DUPLICATE_THRESHOLD
+):
+    """ENTRY POINT: Writes Craigslist housing posts (category `apa`) to database while scraping continues,
+    committing every `chunk_size` posts. Returns a dictionary counting posts that were inserted, updated and
+    skipped, and posts found to be near duplicates with a similarity of at least `duplicate_threshold` (see
+    `write_duplicate_signatures`). Posts of every area and price band that was scraped are written even if
+    other bands failed, in which case ScrapeError is raised afterwards. If `progress_path` is set, written bands
+    are recorded there and the next call only scrapes the rest - including after the process died part way."""
+    scraper = ApaScraper(site, areas, progress=ScrapeProgress(progress_path))
+    # Posts deleted since the last write (e.g. expired) are left out of comparisons with new posts.
+    prune_duplicate_signatures()
+    counts = ingest_craigslist_apa(scraper, chunk_size, duplicate_threshold)
+    # Posts deleted since the last write (e.g. expired) are left in the search index until now.
+    prune_search_index()
+    if scraper.failed:
+        raise ScrapeError(f"Failed to scrape {len(scraper.failed)} tasks: {scraper.failed}")
+    # Every band was written - start the next scrape from scratch.
+    scraper.progress.clear()
+    return counts
+
+
+def ingest_craigslist_apa(scraper, chunk_size=WRITE_CHUNK_SIZE, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Consumes posts from `ApaScraper` instance as they are scraped and writes them to database in
+    chunks of `chunk_size` posts. Bands are marked done in the scraper's progress once all of their posts
+    were committed. Returns a dictionary of counts as in `upsert_craigslist_housing`."""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "duplicates": 0}
+    rows = []
+    scraped_tasks = []
     post_id_ref = set()
-    for apa in yield_apa(*args, **kwargs):
-        for post in apa.search_detail():
+    for task, post in scraper.scrape():
+        if post is None:
+            # Posts of a task come before its completion - they are in `rows` or already committed.
+            scraped_tasks.append(task)
+        else:
             post_id = int(post["id"])
-            # Performs checks to ensure no duplication of ID in current search and CraigslistHousing table.
-            if post_id in post_id_ref or CraigslistHousing.query.get(post_id):
+            # Performs check to ensure no duplication of ID in current search. Posts already in the
+            # CraigslistHousing table are sorted out in bulk by `upsert_craigslist_housing`.
+            if post_id in post_id_ref:
                 continue
             post_id_ref.add(post_id)
-            posts.append(post)
-            # Don't add to database here, we want to writing to database executed ASAP.
-            # i.e. no unnecessary write latency during Craigslist scraping.
-    return posts
+            rows.append(build_housing_row(post))
+        if len(rows) >= chunk_size:
+            add_counts(
+                counts,
+                write_housing_rows_and_progress(rows, scraped_tasks, scraper.progress, chunk_size, duplicate_threshold),
+            )
+            rows, scraped_tasks = [], []
+    add_counts(
+        counts, write_housing_rows_and_progress(rows, scraped_tasks, scraper.progress, chunk_size, duplicate_threshold)
+    )
+    return counts
+
+
+def write_housing_rows_and_progress(
+    rows, tasks, progress, chunk_size=WRITE_CHUNK_SIZE, duplicate_threshold=DUPLICATE_THRESHOLD
+):
+    """Writes CraigslistHousing `rows` to database in chunks of `chunk_size` rows, then marks `tasks` done in
+    `progress`. Returns a dictionary of counts as in `upsert_craigslist_housing`."""
+    counts = upsert_craigslist_housing(rows, chunk_size, duplicate_threshold)
+    if rows:
+        # Committed rows are served right away - invalidate cached API responses.
+        bump_data_version(CraigslistHousing.__tablename__)
+    progress.mark_done(tasks)
+    return counts
+
+
+def add_counts(counts, other_counts):
+    """Adds `other_counts` to dictionary `counts` in place."""
+    for key, count in other_counts.items():
+        counts[key] += count
+
 
+def build_housing_row(post):
+    """Builds a CraigslistHousing row as a dictionary of column values from a scraped post."""
+    return {
+        "id": int(post["id"]),
+        "site": post.get("site", ""),
+        "area": post.get("area", "0"),
+        "repost_of": post.get("repost_of", ""),
+        "last_updated": datetime.strptime(post["last_updated"], "%Y-%m-%d %H:%M"),
+        "title": post.get("title", ""),
+        "neighborhood": post.get("neighborhood", "").lower(),
+        "address": post.get("address", ""),
+        # Coordinates for Guest Peninsula, Antactica if there's no lat or lon.
+        "lat": "-76.299965" if not post.get("lat") else post["lat"],
+        "lon": "-148.003021" if not post.get("lon") else post["lon"],
+        # Convert price into numerics: e.g. '$1,500' --> '1500'
+        "price": post.get("price", "0").replace("$", "").replace(",", ""),
+        "housing_type": post.get("housing_type", ""),
+        "bedrooms": post.get("bedrooms", "0"),
+        "flooring": post.get("flooring", ""),
+        "is_furnished": bool(post.get("is_furnished")),
+        "no_smoking": bool(post.get("no_smoking", "false")),
+        "ft2": post.get("area-ft2", "0"),
+        "laundry": post.get("laundry", ""),
+        "parking": post.get("parking", ""),
+        "rent_period": post.get("rent_period", ""),
+        "url": post.get("url", ""),
+        "misc": ";".join(post.get("misc", [])),
+        "_title_neighborhood": f'{post.get("neighborhood", "")}{post.get("title", "")}',
+        "geocell": get_geocell(post.get("lat"), post.get("lon")),
+    }
 
-def yield_apa(site, areas):
-    """Yields detailed posts from `pycraigslist.housing.apa` instances."""
-    # Attempt to query pycraigslist instances even if there's a connection error.
-    for i in range(4):
+
+def upsert_craigslist_housing(rows, chunk_size=WRITE_CHUNK_SIZE, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Writes CraigslistHousing `rows` to database in chunks of `chunk_size` rows, one transaction per
+    chunk. New posts are inserted and posts updated on Craigslist since they were written (i.e. reposted
+    or edited) are updated. Returns a dictionary counting posts that were inserted, updated and skipped,
+    and posts marked near duplicates given `duplicate_threshold`."""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "duplicates": 0}
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i : i + chunk_size]
+        try:
+            chunk_counts = write_housing_chunk(chunk, duplicate_threshold)
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            # Isolate the offending rows rather than losing the whole chunk.
+            chunk_counts = write_housing_rows(chunk, duplicate_threshold)
+        add_counts(counts, chunk_counts)
+    return counts
+
+
+def write_housing_chunk(rows, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Writes CraigslistHousing `rows` to database in a single transaction. Existing posts are found
+    with one query rather than one query per row. Returns a dictionary of counts as in
+    `upsert_craigslist_housing`."""
+    existing = dict(
+        db.session.execute(
+            select(CraigslistHousing.id, CraigslistHousing.last_updated).where(
+                CraigslistHousing.id.in_([row["id"] for row in rows])
+            )
+        ).all()
+    )
+    new_rows = [row for row in rows if row["id"] not in existing]
+    # Scores are left as they are - see `write_craigslist_housing_score`.
+    updated_rows = [row for row in rows if row["id"] in existing and row["last_updated"] > existing[row["id"]]]
+    if new_rows:
+        # Posts written concurrently since `existing` was read aren't inserted - they're counted as skipped.
+        new_rows = insert_housing_rows(new_rows)
+    if updated_rows:
+        db.session.execute(update(CraigslistHousing), updated_rows)
+    # Searchable as soon as they're committed - a no-op where the database maintains its own index.
+    write_search_index(new_rows + updated_rows)
+    # Only compared with posts sharing an LSH bucket, rather than every post in the table.
+    duplicates = write_duplicate_signatures(new_rows + updated_rows, duplicate_threshold)
+    db.session.commit()
+    return {
+        "inserted": len(new_rows),
+        "updated": len(updated_rows),
+        "skipped": len(rows) - len(new_rows) - len(updated_rows),
+        "duplicates": duplicates,
+    }
+
+
+def write_housing_rows(rows, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Writes CraigslistHousing `rows` to database one transaction per row, skipping rows that fail
+    to write. Returns a dictionary of counts as in `upsert_craigslist_housing`."""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "duplicates": 0}
+    for row in rows:
         try:
-            yield from [
-                pycraigslist.housing.apa(site=site, area=area, filters=query_filter)
-                for area in areas
-                for query_filter in yield_apa_filters()
-            ]
-            # Break out if successfully executed.
-            return
-        except HTTPError:
-            if i == 3:
-                # Raise error if error cannot be resolved in 3 attempts.
-                raise HTTPError from HTTPError
-            # Wait a minute before reattempting query.
-            time.sleep(60)
-
-
-def yield_apa_filters():
-    """Yields `pycraigslist.housing.apa` filters for subsequent queries."""
-    # Only filter for prices, ranging from $500 - $8000 in $500 increments to gain more listing coverage.
-    # Craigslist limits number of posts to 3000 for any given query.
-    yield from [
-        {"min_price": min_price, "max_price": max_price}
-        for min_price, max_price in zip(range(500, 8000, 500), range(1000, 8500, 500))
-    ]
+            row_counts = write_housing_chunk([row], duplicate_threshold)
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            row_counts = {"skipped": 1}
+        add_counts(counts, row_counts)
+    return counts
+
+
+def insert_housing_rows(rows):
+    """Inserts CraigslistHousing `rows` into database, skipping posts whose ID was written concurrently
+    (e.g. by an overlapping cron run), where the database dialect supports it. Not committed. Returns the
+    rows that were inserted."""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(CraigslistHousing).on_conflict_do_nothing(index_elements=["id"])
+    elif dialect == "sqlite":
+        statement = sqlite.insert(CraigslistHousing).on_conflict_do_nothing(index_elements=["id"])
+    else:
+        db.session.execute(insert(CraigslistHousing), rows)
+        return rows
+    # Skipped posts return no ID.
+    inserted_ids = set(db.session.execute(statement.returning(CraigslistHousing.id), rows).scalars())
+    return [row for row in rows if row["id"] in inserted_ids]
@@ -0,0 +1,229 @@
+"""
+/irahorecka/api/craigslisthousing/write/scrape.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to schedule concurrent scrapes of Craigslist housing posts, one task per area and price band.
+"""
+
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pycraigslist
+from pycraigslist.exceptions import HTTPError
+from requests.exceptions import ConnectionError
+
+# Number of area and price band tasks scraped concurrently.
+SCRAPE_MAX_WORKERS = 4
+# Requests to Craigslist per second, shared by every task.
+SCRAPE_REQUESTS_PER_SECOND = 10
+# Attempts per task before giving up on it.
+SCRAPE_ATTEMPTS = 4
+# Scraped posts waiting to be written to database, shared by every task.
+SCRAPE_QUEUE_SIZE = 1000
+# Base and cap of the exponential backoff between attempts in seconds.
+SCRAPE_BACKOFF_BASE = 15
+SCRAPE_BACKOFF_CAP = 300
+# Seconds between checks of whether the scrape was stopped while a task backs off.
+SCRAPE_STOP_INTERVAL = 1
+
+ApaTask = namedtuple("ApaTask", "site area min_price max_price")
+
+
+class ApaScraper:
+    """Scrapes detailed Craigslist housing posts (category `apa`) of `site` and `areas`, one task per area
+    and price band. Tasks are retried independently with exponential backoff and jitter - tasks that fail
+    every attempt are collected in `failed` without affecting the others, completed tasks in `completed`.
+    `apa` and `sleep` default to `pycraigslist.housing.apa` and `time.sleep` and may be swapped out for
+    local stand-ins - `sleep` spaces out requests and backs off between attempts."""
+
+    def __init__(
+        self,
+        site,
+        areas,
+        progress=None,
+        apa=pycraigslist.housing.apa,
+        max_workers=SCRAPE_MAX_WORKERS,
+        requests_per_second=SCRAPE_REQUESTS_PER_SECOND,
+        attempts=SCRAPE_ATTEMPTS,
+        backoff_base=SCRAPE_BACKOFF_BASE,
+        queue_size=SCRAPE_QUEUE_SIZE,
+        sleep=time.sleep,
+    ):
+        self.tasks = list(yield_apa_tasks(site, areas))
+        self.progress = progress if progress is not None else ScrapeProgress()
+        self.apa = apa
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(requests_per_second, sleep=sleep)
+        self.sleep = sleep
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.queue_size = queue_size
+        self.completed = []
+        self.failed = []
+        self._stopped = threading.Event()
+
+    def scrape(self):
+        """Yields tuples of a task and a post as posts are scraped, then a tuple of the task and None once
+        every post of the task was yielded. Tasks marked done in `self.progress` by a previous run are
+        skipped. Scraped posts wait in a queue of `self.queue_size` posts - tasks pause while the queue is
+        full, so memory is bounded however slowly the caller consumes posts."""
+        tasks = [task for task in self.tasks if not self.progress.is_done(task)]
+        events = queue.Queue(maxsize=self.queue_size)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = [executor.submit(self.run_task, task, events) for task in tasks]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                task, post = events.get()
+                if isinstance(post, Exception):
+                    remaining -= 1
+                    if not isinstance(post, (ConnectionError, HTTPError)):
+                        raise post
+                    self.failed.append(task)
+                    continue
+                if post is None:
+                    remaining -= 1
+                    self.completed.append(task)
+                yield task, post
+        finally:
+            # Unblock and stop tasks if the caller stopped early, e.g. on a database error.
+            self._stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            while not all(future.done() for future in futures):
+                try:
+                    events.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def run_task(self, task, events):
+        """Scrapes `task`, putting tuples of the task and each post on `events`. Always finishes with
+        a tuple of the task and either None or the error the task failed with."""
+        try:
+            for post in self.scrape_task(task):
+                events.put((task, post))
+        except Exception as e:
+            events.put((task, e))
+        else:
+            events.put((task, None))
+
+    def scrape_task(self, task):
+        """Yields detailed posts of `task`. Reattempts the task from scratch if a request fails - posts
+        yielded by a failed attempt may be yielded again. Raises the last error if every attempt fails."""
+        for attempt in range(self.attempts):
+            try:
+                yield from self.yield_posts(task)
+                return
+            except (ConnectionError, HTTPError):
+                if attempt == self.attempts - 1:
+                    raise
+                # Returns early if the scrape was stopped.
+                if self.backoff(get_backoff(attempt, base=self.backoff_base)):
+                    return
+
+    def backoff(self, seconds):
+        """Sleeps `seconds` with `self.sleep`, checking every `SCRAPE_STOP_INTERVAL` seconds whether the scrape
+        was stopped. Returns True if it was."""
+        while seconds > 0 and not self._stopped.is_set():
+            self.sleep(min(seconds, SCRAPE_STOP_INTERVAL))
+            seconds -= SCRAPE_STOP_INTERVAL
+        return self._stopped.is_set()
+
+    def yield_posts(self, task):
+        """Yields detailed posts of `task`, waiting on the shared rate limiter before each request."""
+        filters = {"min_price": task.min_price, "max_price": task.max_price}
+        self.limiter.wait()
+        posts = self.apa(site=task.site, area=task.area, filters=filters).search_detail()
+        while not self._stopped.is_set():
+            # Each detailed post is fetched with its own request.
+            self.limiter.wait()
+            try:
+                yield next(posts)
+            except StopIteration:
+                return
+
+
+class RateLimiter:
+    """Spaces out calls to `wait` by at least 1 / `rate` seconds across threads."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the caller may make a request."""
+        with self._lock:
+            now = self.clock()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            self.sleep(wait_time)
+
+
+class ScrapeProgress:
+    """Set of completed scrape tasks. Persisted to JSON file `path` if set, so that a scrape that failed
+    part way can be resumed without redoing completed tasks."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._done = set()
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self._done = {ApaTask(*task) for task in json.load(file)}
+
+    def is_done(self, task):
+        """Returns True if `task` was completed."""
+        return task in self._done
+
+    def mark_done(self, tasks):
+        """Marks `tasks` as completed. Only mark tasks whose posts were written to database."""
+        self._done.update(tasks)
+        self._save()
+
+    def clear(self):
+        """Forgets every completed task - the next scrape starts from scratch."""
+        self._done = set()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        """Writes completed tasks to `self.path`, replacing the file atomically."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as file:
+            json.dump(sorted(self._done), file)
+        os.replace(file.name, self.path)
+
+
+def yield_apa_tasks(site, areas):
+    """Yields a scrape task per area of `site` and price band."""
+    for area in areas:
+        for query_filter in yield_apa_filters():
+            yield ApaTask(site, area, query_filter["min_price"], query_filter["max_price"])
+
+
+def yield_apa_filters():
+    """Yields `pycraigslist.housing.apa` filters for subsequent queries."""
+    # Only filter for prices, ranging from $500 - $8000 in $500 increments to gain more listing coverage.
+    # Craigslist limits number of posts to 3000 for any given query.
+    yield from [
+        {"min_price": min_price, "max_price": max_price}
+        for min_price, max_price in zip(range(500, 8000, 500), range(1000, 8500, 500))
+    ]
+
+
+def get_backoff(attempt, base=SCRAPE_BACKOFF_BASE, cap=SCRAPE_BACKOFF_CAP):
+    """Returns seconds to wait before reattempting a task after failed `attempt` (zero-based). Full jitter:
+    a random duration up to an exponentially growing, capped ceiling - concurrent tasks that failed
+    together don't retry together."""
+    return random.uniform(0, min(cap, base * 2**attempt))
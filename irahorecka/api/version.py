@@ -0,0 +1,64 @@
+"""
+/irahorecka/api/version.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to read and bump the data version of database tables. Readers use the version to
+invalidate anything derived from a table, e.g. cached API responses.
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from irahorecka.models import db, DataVersion
+
+# Seconds a data version read from database is reused by the process, so that conditional requests are
+# answered without querying the database. Bumps by other processes (e.g. the update_db.py cron) are seen
+# up to this late - bumps by this process are seen right away.
+DATA_VERSION_TTL = 2
+# Data versions read by this process, keyed by table - tuples of when they expire, the version and when the
+# table was last modified.
+_data_versions = {}
+
+
+def read_data_version(table):
+    """Returns a tuple of the data version of `table` and when it was last modified. A table
+    that was never bumped is at version 0 with no modification time. Versions are read from
+    database at most once every `DATA_VERSION_TTL` seconds."""
+    cached = _data_versions.get(table)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1:]
+    data_version = db.session.get(DataVersion, table)
+    version = (0, None) if data_version is None else (data_version.version, data_version.last_modified)
+    _data_versions[table] = (time.monotonic() + DATA_VERSION_TTL, *version)
+    return version
+
+
+def bump_data_version(table):
+    """Increments the data version of `table`. To be called after committing writes to `table`. The
+    version is incremented by the database in a single statement - concurrent writers (e.g. sites updated
+    in parallel) each get a version of their own."""
+    # Truncate to seconds - HTTP dates (e.g. Last-Modified) don't carry sub-second precision.
+    last_modified = datetime.utcnow().replace(microsecond=0)
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(DataVersion).values(table=table, version=1, last_modified=last_modified)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[DataVersion.table],
+                set_={"version": DataVersion.version + 1, "last_modified": statement.excluded.last_modified},
+            )
+        )
+    else:
+        bumped = db.session.execute(
+            update(DataVersion)
+            .where(DataVersion.table == table)
+            .values(version=DataVersion.version + 1, last_modified=last_modified)
+        ).rowcount
+        if not bumped:
+            db.session.add(DataVersion(table=table, version=1, last_modified=last_modified))
+    db.session.commit()
+    _data_versions.pop(table, None)
@@ -0,0 +1,134 @@
+"""
+/irahorecka/cache.py
+~~~~~~~~~~~~~~~~~~~~
+
+Module to cache values computed by the Flask application, e.g. API responses.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class Cache:
+    """Flask extension to cache values in a pluggable backend. Counts cache hits and misses.
+    Backends must implement `get(key)` (returning None on a miss), `set(key, value)` and `__len__`."""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configures backend from app config. Caches on the filesystem if `CACHE_DIR` is set, which
+        is shared by every uWSGI worker. Otherwise caches in-process."""
+        maxsize = app.config.get("CACHE_MAX_ENTRIES", 1024)
+        if app.config.get("CACHE_DIR"):
+            self.backend = FileSystemBackend(app.config["CACHE_DIR"], maxsize=maxsize)
+        else:
+            self.backend = LRUBackend(maxsize=maxsize)
+
+    def get_or_set(self, key, fn):
+        """Returns cached value of string `key`. On a miss, calls `fn` and caches its return value."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = fn()
+        self.backend.set(key, value)
+        return value
+
+    def stats(self):
+        """Returns hit and miss counters of this process."""
+        requests = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+class LRUBackend:
+    """In-process cache backend. Evicts least recently used values past `maxsize` entries."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key):
+        """Returns cached value of `key` or None."""
+        with self._lock:
+            if key not in self._values:
+                return None
+            self._values.move_to_end(key)
+            return self._values[key]
+
+    def set(self, key, value):
+        """Caches `value` as `key`."""
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+
+class FileSystemBackend:
+    """Cache backend storing pickled values in a directory, shared by processes on the same host.
+    Evicts least recently written values past `maxsize` entries. The directory must be private to
+    the application as values are unpickled."""
+
+    def __init__(self, path, maxsize=1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.maxsize = maxsize
+
+    def __len__(self):
+        return sum(1 for entry in self.path.iterdir() if entry.suffix == ".cache")
+
+    def get(self, key):
+        """Returns cached value of `key` or None."""
+        try:
+            with open(self._get_path(key), "rb") as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        """Caches `value` as `key`. Writes to a temporary file first so that concurrent readers never
+        see a partially written value."""
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix=".tmp", delete=False) as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, self._get_path(key))
+        self._evict()
+
+    def _get_path(self, key):
+        """Returns path to file caching `key`."""
+        return self.path.joinpath(f"{hashlib.sha256(key.encode()).hexdigest()}.cache")
+
+    def _evict(self):
+        """Removes least recently written values past `self.maxsize` entries."""
+        entries = [entry for entry in self.path.iterdir() if entry.suffix == ".cache"]
+        if len(entries) <= self.maxsize:
+            return
+        # Other processes may evict the same entries concurrently - ignore entries that are gone.
+        mtimes = {}
+        for entry in entries:
+            try:
+                mtimes[entry] = entry.stat().st_mtime
+            except FileNotFoundError:
+                pass
+        for entry in sorted(mtimes, key=mtimes.get)[: len(mtimes) - self.maxsize]:
+            entry.unlink(missing_ok=True)
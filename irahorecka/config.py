@@ -19,3 +19,14 @@ class Config:
     SECRET_KEY = os.environ["SECRET_KEY"]
     SQLALCHEMY_DATABASE_URI = os.environ["SQLALCHEMY_DATABASE_URI"]
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Directory to cache API responses in, shared by every uWSGI worker. Cache in-process if unset.
+    CACHE_DIR = os.environ.get("CACHE_DIR")
+    CACHE_MAX_ENTRIES = 1024
+    # JSON provider serializing responses - 'orjson' (falls back to 'json' if not installed) or 'json'.
+    JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "orjson")
+    # JSON file recording Craigslist housing scrape progress - a failed scrape resumes where it left off.
+    SCRAPE_PROGRESS_PATH = os.environ.get("SCRAPE_PROGRESS_PATH")
+    # Number of processes scoring Craigslist housing areas in parallel.
+    SCORE_PROCESSES = int(os.environ.get("SCORE_PROCESSES", 1))
+    # Minimum similarity (0 - 1) of a Craigslist housing post to a newer post for it to be removed as a repost.
+    DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", 0.7))
@@ -28,3 +28,11 @@ class InvalidUsage(Exception):
 
 class ValidationError(Exception):
     """Validation of request args failed."""
+
+
+class ScrapeError(Exception):
+    """Scraping failed for one or more tasks."""
+
+
+class UpdateError(Exception):
+    """Updating one or more Craigslist housing sites failed."""
@@ -7,22 +7,54 @@ Flask blueprint to handle routes for *.irahorecka.com/housing*.
 
 from pathlib import Path
 
-from flask import abort, jsonify, render_template, request, session, Blueprint
+from flask import (
+    abort,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    Blueprint,
+    Response,
+)
 
-from irahorecka import limiter
-from irahorecka.api import read_craigslist_housing, AREAS
+from irahorecka import cache, limiter
+from irahorecka.api import (
+    CraigslistHousingMapPage,
+    CraigslistHousingPage,
+    CraigslistHousingStatsPage,
+    AREAS,
+    HOUSING_CONFIG,
+)
 from irahorecka.exceptions import ValidationError
 from irahorecka.housing.utils import (
+    build_columns_response,
     get_area_key,
     get_neighborhoods,
+    get_response_format,
+    is_not_modified,
     parse_form,
     read_json,
+    set_conditional_headers,
+    set_next_cursor,
+    stream_json,
+    stream_ndjson,
     tidy_posts,
+    COLUMNAR_FORMATS,
+    RESPONSE_FORMATS,
 )
 
 housing = Blueprint("housing", __name__)
 DOCS = read_json(Path(__file__).absolute().parent.joinpath("docs.json"))
-REGISTERED_APIS = read_json(Path(__file__).absolute().parent.joinpath("api.json"))
+# Sites and areas served by the API - the same registry drives database updates.
+REGISTERED_APIS = HOUSING_CONFIG["sites"]
+# Let caches store responses, but revalidate with the ETag before reusing them - the CraigslistHousing
+# table may change with any cron run. HTMX fragments depend on the caller's session, so keep them private.
+API_CACHE_CONTROL = {"public": True, "no_cache": True}
+HTMX_CACHE_CONTROL = {"private": True, "no_cache": True}
+# API pages with more posts than this are streamed rather than built in memory (and cached).
+STREAM_MIN_LIMIT = 500
 
 
 @housing.route("/housing")
@@ -52,8 +84,7 @@ def query_new():
     query_params = session["query_params"] = parse_form(request.form)
     sort_by = session["sort_by"] = "date_desc"
     limit = session["limit"] = 50
-    offset = session["offset"] = 0
-    return render_housing_table("housing/table.html", query_params, sort_by, limit, offset)
+    return render_housing_table("housing/table.html", query_params, sort_by, limit)
 
 
 @housing.route("/housing/query/score", methods=["POST"])
@@ -63,35 +94,44 @@ def query_score():
     query_params = session["query_params"] = parse_form(request.form)
     sort_by = session["sort_by"] = "score_desc"
     limit = session["limit"] = 50
-    offset = session["offset"] = 0
-    return render_housing_table("housing/table.html", query_params, sort_by, limit, offset)
+    return render_housing_table("housing/table.html", query_params, sort_by, limit)
 
 
 @housing.route("/housing/query/infinite-scroll")
 def query_infinite_scroll():
     """Handles rendering of template from HTMX call to /housing/query/infinite-scroll.
     Returns chunked Craigslist Housing content as table rows with number of rows equivalent
-    to the 'limit' parameter passed from `query_new` or `query_score`."""
+    to the 'limit' parameter passed from `query_new` or `query_score`. The next page is
+    located by the opaque `cursor` rendered into the previous page's last row."""
     # Parameters from Flask session.
     query_params = session["query_params"]
     limit = session["limit"]
-    offset = session["offset"] = session["limit"] + session["offset"]
     sort_by = session["sort_by"]
-    return render_housing_table("housing/tbody.html", query_params, sort_by, limit, offset)
+    try:
+        return render_housing_table(
+            "housing/tbody.html", query_params, sort_by, limit, cursor=request.args.get("cursor")
+        )
+    except ValidationError as e:
+        abort(400, str(e))
 
 
-def render_housing_table(html_path, query_params, sort_by, limit, offset):
+def render_housing_table(html_path, query_params, sort_by, limit, cursor=None):
     """Fetches caller's query from the CraigslistHousing table in database and renders and
-    updates housing table from the provided HTML path."""
+    updates housing table from the provided HTML path. Returns an empty 304 response instead if
+    the caller's copy is current."""
     # Fetches minified posts.
-    posts = list(read_craigslist_housing(query_params, sort_by=sort_by, limit=limit, offset=offset, minified=True))
+    page = CraigslistHousingPage(query_params, sort_by=sort_by, limit=limit, cursor=cursor, minified=True)
+    if is_not_modified(page.etag, page.last_modified):
+        return set_conditional_headers(Response(status=304), page.etag, page.last_modified, HTMX_CACHE_CONTROL)
+    posts, next_cursor = page.read()
     content = {
         "posts": tidy_posts(posts),
         "limit": limit,
-        "offset": offset,
+        "cursor": next_cursor,
         "sort_by": sort_by,
     }
-    return render_template(html_path, content=content)
+    response = make_response(render_template(html_path, content=content))
+    return set_conditional_headers(response, page.etag, page.last_modified, HTMX_CACHE_CONTROL)
 
 
 #  ~~~~~~~~~~ BEGIN RESTFUL API AND API DOCS ~~~~~~~~~~
@@ -105,11 +145,7 @@ def api_site(site):
     if site not in REGISTERED_APIS:
         abort(404)
     params = {**{"site": site}, **request.args.to_dict()}
-    try:
-        posts = list(read_craigslist_housing(params))
-        return jsonify(posts)
-    except ValidationError as e:
-        abort(400, str(e))
+    return render_housing_api(params)
 
 
 @housing.route("/housing/<site>/<area>", subdomain="api")
@@ -121,11 +157,95 @@ def api_site_area(site, area):
     if area not in REGISTERED_APIS.get(site, []):
         abort(404)
     params = {**{"site": site, "area": area}, **request.args.to_dict()}
+    return render_housing_api(params)
+
+
+def render_housing_api(params):
+    """Fetches caller's query from the CraigslistHousing table in database and returns posts in the
+    requested format. Returns an empty 304 response before querying posts if the caller's copy is current.
+    Large pages and NDJSON are streamed from the database instead of being built in memory. Columnar
+    formats are built in memory - a page of columns is much smaller than a page of posts."""
+    response_format = get_response_format(params.pop("format", None))
+    if response_format is None:
+        abort(400, str({"format": [f"unallowed value {request.args['format']}"]}))
     try:
-        posts = list(read_craigslist_housing(params))
-        return jsonify(posts)
+        page = CraigslistHousingPage(params)
     except ValidationError as e:
         abort(400, str(e))
+    # Every format is a different representation of the page - each gets its own ETag.
+    etag = f"{page.etag}-{response_format}"
+    if is_not_modified(etag, page.last_modified):
+        response = Response(status=304)
+        # A 304 must carry the Vary of the 200 it validates, or caches may reuse it across formats.
+        response.vary.add("Accept")
+        return set_conditional_headers(response, etag, page.last_modified, API_CACHE_CONTROL)
+    if response_format in COLUMNAR_FORMATS:
+        columns, next_cursor = page.read_columns()
+        response = set_next_cursor(build_columns_response(columns, response_format), next_cursor)
+    elif response_format == "ndjson" or page.validated_args["limit"] > STREAM_MIN_LIMIT:
+        stream = stream_ndjson if response_format == "ndjson" else stream_json
+        response = Response(stream_with_context(stream(page.stream())), mimetype=RESPONSE_FORMATS[response_format])
+        # Headers are sent before the body - fetch the next page's cursor up front.
+        response = set_next_cursor(response, page.next_cursor())
+    else:
+        posts, next_cursor = page.read()
+        response = set_next_cursor(jsonify(posts), next_cursor)
+    response.vary.add("Accept")
+    return set_conditional_headers(response, etag, page.last_modified, API_CACHE_CONTROL)
+
+
+@housing.route("/housing/<site>/stats", subdomain="api")
+@limiter.limit("10/second")
+def api_site_stats(site):
+    """Market statistics of Craigslist housing posts within a Craigslist site."""
+    if site not in REGISTERED_APIS:
+        abort(404)
+    params = {**request.args.to_dict(), **{"site": site}}
+    return render_housing_stats(params)
+
+
+@housing.route("/housing/<site>/<area>/stats", subdomain="api")
+@limiter.limit("10/second")
+def api_site_area_stats(site, area):
+    """Market statistics of Craigslist housing posts within a Craigslist site and area."""
+    if area not in REGISTERED_APIS.get(site, []):
+        abort(404)
+    params = {**request.args.to_dict(), **{"site": site, "area": area}}
+    return render_housing_stats(params)
+
+
+def render_housing_stats(params):
+    """Returns materialized market statistics of the caller's query as JSON. Returns an empty 304 response
+    before querying statistics if the caller's copy is current."""
+    try:
+        stats = CraigslistHousingStatsPage(params)
+    except ValidationError as e:
+        abort(400, str(e))
+    if is_not_modified(stats.etag, stats.last_modified):
+        return set_conditional_headers(Response(status=304), stats.etag, stats.last_modified, API_CACHE_CONTROL)
+    return set_conditional_headers(jsonify(stats.read()), stats.etag, stats.last_modified, API_CACHE_CONTROL)
+
+
+@housing.route("/housing/<site>/map", subdomain="api")
+@limiter.limit("10/second")
+def api_site_map(site):
+    """Clusters of Craigslist housing posts within a Craigslist site, per grid cell of a map zoom level."""
+    if site not in REGISTERED_APIS:
+        abort(404)
+    params = {**request.args.to_dict(), **{"site": site}}
+    try:
+        clusters = CraigslistHousingMapPage(params)
+    except ValidationError as e:
+        abort(400, str(e))
+    if is_not_modified(clusters.etag, clusters.last_modified):
+        return set_conditional_headers(Response(status=304), clusters.etag, clusters.last_modified, API_CACHE_CONTROL)
+    return set_conditional_headers(jsonify(clusters.read()), clusters.etag, clusters.last_modified, API_CACHE_CONTROL)
+
+
+@housing.route("/housing/cache", subdomain="api")
+def api_cache():
+    """Hit and miss counters of the housing API response cache for this worker."""
+    return jsonify(cache.stats())
 
 
 @housing.route("/housing", subdomain="docs")
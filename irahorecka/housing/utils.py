@@ -6,9 +6,31 @@ Utility module to support /irahorecka/housing/routes.py.
 """
 
 import json
+from urllib.parse import urlencode
+
+from flask import current_app, jsonify, request, Response
 
 from irahorecka.api import AREA_KEYS, NEIGHBORHOODS
 
+try:
+    import msgpack
+except ImportError:
+    # MessagePack responses are not offered - see `RESPONSE_FORMATS`.
+    msgpack = None
+
+# Response formats of the housing API mapped to their mimetypes.
+RESPONSE_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    # Column-oriented JSON - one array per key. Only served if requested via the `format` arg.
+    "columns": "application/json",
+}
+if msgpack is not None:
+    # Column-oriented MessagePack.
+    RESPONSE_FORMATS["msgpack"] = "application/msgpack"
+# Response formats serving posts as columns rather than rows.
+COLUMNAR_FORMATS = ("columns", "msgpack")
+
 
 def get_area_key(key):
     """Returns area key read from key provided by caller. Default to empty
@@ -62,10 +84,81 @@ def parse_form(request_form):
 
 def tidy_posts(posts):
     """Tidies an iterable of posts provided by caller. Currently the only tidiness is
-    adding score color and letter based on the provided score."""
+    adding score color and letter based on the provided score. Returns tidied copies of
+    posts - the originals may be shared by the response cache."""
+    tidied_posts = []
+    for post in posts:
+        score_class, score_letter = get_score_class_and_letter(post["score"])
+        tidied_posts.append({**post, "score_class": score_class, "score_letter": score_letter})
+    return tidied_posts
+
+
+def set_next_cursor(response, cursor):
+    """Exposes the opaque cursor to the next page of an API response via the `X-Next-Cursor`
+    and `Link` headers. The response body is left untouched. Nothing is set on the last page."""
+    if cursor is None:
+        return response
+    args = {**request.args.to_dict(), "cursor": cursor}
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def get_response_format(requested_format=None):
+    """Returns housing API response format requested by caller via the `format` arg, else via the
+    Accept header. Defaults to JSON. Returns None if the `format` arg is not a known format."""
+    if requested_format is not None:
+        return requested_format if requested_format in RESPONSE_FORMATS else None
+    # Ties (e.g. `*/*`) go to the first format - JSON. 'columns' shares its mimetype and is never negotiated.
+    mimetype = request.accept_mimetypes.best_match(RESPONSE_FORMATS.values(), default=RESPONSE_FORMATS["json"])
+    return next(key for key, value in RESPONSE_FORMATS.items() if value == mimetype)
+
+
+def stream_json(posts):
+    """Yields an iterable of posts as a JSON array, one post at a time. Output is identical to
+    `flask.jsonify` as both serialize with the app's JSON provider."""
+    dumps = current_app.json.dumps_compact
+    yield "["
+    for i, post in enumerate(posts):
+        yield f"{',' if i else ''}{dumps(post)}"
+    yield "]\n"
+
+
+def stream_ndjson(posts):
+    """Yields an iterable of posts as newline-delimited JSON, one post at a time."""
+    dumps = current_app.json.dumps_compact
     for post in posts:
-        post["score_class"], post["score_letter"] = get_score_class_and_letter(post["score"])
-    return posts
+        yield f"{dumps(post)}\n"
+
+
+def build_columns_response(columns, response_format):
+    """Returns response of posts as `columns` in a columnar `response_format` - 'columns' or 'msgpack'."""
+    if response_format == "msgpack":
+        return Response(msgpack.packb(columns), mimetype=RESPONSE_FORMATS["msgpack"])
+    return jsonify(columns)
+
+
+def is_not_modified(etag, last_modified):
+    """Returns True if caller's conditional GET request shows that their copy of a resource with
+    `etag` and `last_modified` (naive UTC) is current."""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232, section 6).
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def set_conditional_headers(response, etag, last_modified, cache_control):
+    """Sets ETag and Last-Modified headers and Cache-Control directives from `cache_control` on response."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    for directive, value in cache_control.items():
+        setattr(response.cache_control, directive, value)
+    return response
 
 
 def read_json(path):
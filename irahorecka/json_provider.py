@@ -0,0 +1,58 @@
+"""
+/irahorecka/json_provider.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to store Flask JSON providers used to serialize responses, e.g. the housing API.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to the standard library's `json` via `JSONProvider`.
+    orjson = None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """JSON provider serializing with the standard library's `json`. Adds `dumps_compact`,
+    which serializes exactly as `response` does in production - use to stream JSON in chunks."""
+
+    def dumps_compact(self, obj):
+        """Serializes `obj` to a JSON string without whitespace."""
+        return self.dumps(obj, separators=(",", ":"))
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider serializing with `orjson`. Keys are sorted like the default provider, but
+    non-ASCII characters are written as UTF-8 rather than escaped."""
+
+    # Serialize datetimes with `self.default` (i.e. as HTTP dates) like the default provider.
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        """Serializes `obj` to a JSON string. Keyword arguments are ignored - `orjson` output is
+        always compact."""
+        return self.dumps_compact(obj)
+
+    def dumps_compact(self, obj):
+        """Serializes `obj` to a JSON string without whitespace."""
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        """Deserializes JSON string or bytes `s`."""
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Serializes arguments as JSON and returns a Flask response. Skips decoding to a string."""
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def get_json_provider(name):
+    """Returns JSON provider class from `name` ('orjson' or 'json'). Falls back to the standard
+    library's `json` if `orjson` is not installed."""
+    if name == "orjson" and orjson is not None:
+        return ORJSONProvider
+    return JSONProvider
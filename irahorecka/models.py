@@ -46,6 +46,35 @@ class CraigslistHousing(db.Model):
     """Model for Craigslist housing post attributes."""
 
     __tablename__ = "craigslisthousing"
+    __table_args__ = (
+        # B-tree composites matching the API's site / area filters and its keyset sort orders.
+        db.Index("ix_craigslisthousing_site_area_last_updated", "site", "area", "last_updated", "id"),
+        db.Index("ix_craigslisthousing_site_area_score", "site", "area", "score", "id"),
+        # Site-wide queries don't filter by area - serve their sort orders without one.
+        db.Index("ix_craigslisthousing_site_last_updated", "site", "last_updated", "id"),
+        db.Index("ix_craigslisthousing_site_score", "site", "score", "id"),
+        # B-tree indexes for enumerated attributes, which are matched exactly.
+        db.Index("ix_craigslisthousing_housing_type", "housing_type"),
+        db.Index("ix_craigslisthousing_laundry", "laundry"),
+        db.Index("ix_craigslisthousing_parking", "parking"),
+        # Trigram index for substring filters - requires the `pg_trgm` extension (see `scripts.db.setup`).
+        # Other dialects (e.g. SQLite for local testing) ignore the `postgresql_*` options and fall back
+        # to a plain B-tree index, which still serves equality lookups.
+        db.Index(
+            "ix_craigslisthousing_neighborhood_trgm",
+            "neighborhood",
+            postgresql_using="gin",
+            postgresql_ops={"neighborhood": "gin_trgm_ops"},
+        ),
+        # Grid cells for location searches - posts without coordinates have no cell and are left out.
+        db.Index(
+            "ix_craigslisthousing_site_geocell",
+            "site",
+            "geocell",
+            postgresql_where=db.text("geocell IS NOT NULL"),
+            sqlite_where=db.text("geocell IS NOT NULL"),
+        ),
+    )
     # `id` is the Craigslist's post ID
     id = db.Column(db.BigInteger, primary_key=True)
     site = db.Column(db.String(8))
@@ -71,6 +100,189 @@ class CraigslistHousing(db.Model):
     misc = db.Column(db.String(480))
     score = db.Column(db.Float)
     _title_neighborhood = db.Column(db.String(240))
+    # Grid cell containing the post's coordinates - null if the post has none. See `get_geocell`.
+    geocell = db.Column(db.BigInteger)
 
     def __repr__(self):
         return f"CraigslistHousing(id={self.id})"
+
+
+# GiST index of posts' coordinates for location searches on PostgreSQL. Other dialects search by `geocell`.
+db.Index(
+    "ix_craigslisthousing_point",
+    db.func.point(CraigslistHousing.lon, CraigslistHousing.lat),
+    postgresql_using="gist",
+    postgresql_where=db.text("geocell IS NOT NULL"),
+).ddl_if(dialect="postgresql")
+# GIN index of the words of posts' title and amenities for full-text searches on PostgreSQL. Other dialects
+# search an FTS5 table - see `irahorecka.api.craigslisthousing.read.search`.
+db.Index(
+    "ix_craigslisthousing_search",
+    db.func.to_tsvector(
+        db.text("'english'::regconfig"),
+        db.func.coalesce(CraigslistHousing.title, "") + " " + db.func.coalesce(CraigslistHousing.misc, ""),
+    ),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+
+class CraigslistHousingCheck(db.Model):
+    """Model for the last expiry check of a Craigslist housing post - see `rm_expired_craigslist_housing`."""
+
+    __tablename__ = "craigslisthousingcheck"
+    __table_args__ = (db.Index("ix_craigslisthousingcheck_next_check_at", "next_check_at"),)
+    # `post_id` is the checked CraigslistHousing post's ID
+    post_id = db.Column(db.BigInteger, primary_key=True)
+    last_checked_at = db.Column(db.DateTime)
+    # HTTP status of the last check - None if the post couldn't be fetched.
+    last_status = db.Column(db.Integer)
+    # Validators of the last response, sent with the next check to make it conditional.
+    etag = db.Column(db.Text)
+    last_modified = db.Column(db.Text)
+    next_check_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"CraigslistHousingCheck(post_id={self.post_id})"
+
+
+class CraigslistHousingScored(db.Model):
+    """Model for a scored Craigslist housing post. Posts without a row, or updated since they were scored,
+    are yet to be scored - see `write_craigslist_housing_score`."""
+
+    __tablename__ = "craigslisthousingscored"
+    # `post_id` is the scored CraigslistHousing post's ID
+    post_id = db.Column(db.BigInteger, primary_key=True)
+    # `CraigslistHousing.last_updated` of the post when it was scored.
+    last_updated = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"CraigslistHousingScored(post_id={self.post_id})"
+
+
+class CraigslistHousingSignature(db.Model):
+    """Model for the MinHash signature of a Craigslist housing post's neighborhood and title - see
+    `write_duplicate_signatures`."""
+
+    __tablename__ = "craigslisthousingsignature"
+    __table_args__ = (
+        # Serves the 'duplicate' cleaning rule - few posts are duplicates.
+        db.Index(
+            "ix_craigslisthousingsignature_duplicate",
+            "post_id",
+            "duplicate_of",
+            postgresql_where=db.text("duplicate_of IS NOT NULL"),
+            sqlite_where=db.text("duplicate_of IS NOT NULL"),
+        ),
+    )
+    # `post_id` is the signed CraigslistHousing post's ID
+    post_id = db.Column(db.BigInteger, primary_key=True)
+    # Unsigned 32-bit integers in native byte order.
+    signature = db.Column(db.LargeBinary)
+    # ID of the newest post this post is a near duplicate of - null if none.
+    duplicate_of = db.Column(db.BigInteger)
+
+    def __repr__(self):
+        return f"CraigslistHousingSignature(post_id={self.post_id})"
+
+
+class CraigslistHousingBucket(db.Model):
+    """Model for a Craigslist housing post in an LSH bucket of its signature's bands - see
+    `write_duplicate_signatures`."""
+
+    __tablename__ = "craigslisthousingbucket"
+    __table_args__ = (db.Index("ix_craigslisthousingbucket_post_id", "post_id"),)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    post_id = db.Column(db.BigInteger, primary_key=True)
+
+    def __repr__(self):
+        return f"CraigslistHousingBucket(bucket={self.bucket}, post_id={self.post_id})"
+
+
+class CraigslistHousingScoreSummary(db.Model):
+    """Model for summary statistics of the last full scoring of Craigslist housing posts in a site and
+    area. Unscored posts are scored against these - see `write_craigslist_housing_score`."""
+
+    __tablename__ = "craigslisthousingscoresummary"
+    site = db.Column(db.String(8), primary_key=True)
+    # An empty area summarizes the whole site.
+    area = db.Column(db.String(8), primary_key=True)
+    # Number of posts summarized, and average and standard deviation of their log(postvalue) - posts with ft2.
+    ft2_count = db.Column(db.Integer)
+    ft2_avg_log_postvalue = db.Column(db.Float)
+    ft2_std_log_postvalue = db.Column(db.Float)
+    # Percentile bounds of raw scores mapped to the min and max normalized scores (area summaries only).
+    ft2_min_score = db.Column(db.Float)
+    ft2_max_score = db.Column(db.Float)
+    # As above - posts without ft2.
+    bedrooms_count = db.Column(db.Integer)
+    bedrooms_avg_log_postvalue = db.Column(db.Float)
+    bedrooms_std_log_postvalue = db.Column(db.Float)
+    bedrooms_min_score = db.Column(db.Float)
+    bedrooms_max_score = db.Column(db.Float)
+    computed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"CraigslistHousingScoreSummary(site={self.site}, area={self.area})"
+
+
+class CraigslistHousingMarketStats(db.Model):
+    """Model for market statistics of Craigslist housing posts in a group - posts of a site grouped by
+    `grouping`. Refreshed after posts are scored - see `write_craigslist_housing_stats`."""
+
+    __tablename__ = "craigslisthousingmarketstats"
+    __table_args__ = (db.Index("ix_craigslisthousingmarketstats_site_grouping_area", "site", "grouping", "area"),)
+    id = db.Column(db.Integer, primary_key=True)
+    site = db.Column(db.String(8))
+    # Comma-separated attributes posts are grouped by, e.g. 'area,bedrooms' - empty for the whole site.
+    grouping = db.Column(db.String(80))
+    # Values of the group's attributes - null if not grouped by the attribute.
+    area = db.Column(db.String(8))
+    neighborhood = db.Column(db.String(240))
+    bedrooms = db.Column(db.Float)
+    housing_type = db.Column(db.String(80))
+    # Number of posts with a price, and percentiles of their price (USD).
+    count = db.Column(db.Integer)
+    price_p25 = db.Column(db.Float)
+    price_median = db.Column(db.Float)
+    price_p75 = db.Column(db.Float)
+    # Number of posts with a price and ft2, and percentiles of their price per ft2 (USD).
+    ft2_count = db.Column(db.Integer)
+    price_per_ft2_p25 = db.Column(db.Float)
+    price_per_ft2_median = db.Column(db.Float)
+    price_per_ft2_p75 = db.Column(db.Float)
+    computed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"CraigslistHousingMarketStats(site={self.site}, grouping={self.grouping})"
+
+
+class CraigslistHousingMapCell(db.Model):
+    """Model for a cluster of Craigslist housing posts in a grid cell of a map zoom level. Refreshed after
+    posts are written - see `write_craigslist_housing_map`."""
+
+    __tablename__ = "craigslisthousingmapcell"
+    site = db.Column(db.String(8), primary_key=True)
+    zoom = db.Column(db.Integer, primary_key=True)
+    # ID of the grid cell of the zoom level's cell size - see `get_geocell`.
+    cell = db.Column(db.BigInteger, primary_key=True)
+    # Average coordinates of the cell's posts - where to place the cluster.
+    lat = db.Column(db.Float)
+    lon = db.Column(db.Float)
+    count = db.Column(db.Integer)
+    # Median price of the cell's posts with a price - null if none has one.
+    price_median = db.Column(db.Float)
+
+    def __repr__(self):
+        return f"CraigslistHousingMapCell(site={self.site}, zoom={self.zoom}, cell={self.cell})"
+
+
+class DataVersion(db.Model):
+    """Model for the version of a table's data. Bumped after every write to the table."""
+
+    __tablename__ = "dataversion"
+    table = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, default=0)
+    last_modified = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"DataVersion(table={self.table}, version={self.version})"
@@ -0,0 +1,8 @@
+"""
+/scripts/bench/__init__.py
+
+Concerns all things benchmarks.
+"""
+
+from scripts.bench.serialize import bench_serialize
+from scripts.bench.validate import bench_validate
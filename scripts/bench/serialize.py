@@ -0,0 +1,115 @@
+"""
+/scripts/bench/serialize.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to benchmark serialization of housing API responses.
+"""
+
+import json
+import random
+import timeit
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from irahorecka.api.craigslisthousing.read.posts import build_housing_post
+from irahorecka.json_provider import get_json_provider
+
+# Columns of the detailed selection of `select_housing_content`.
+HousingRow = namedtuple(
+    "HousingRow",
+    "id repost_of last_updated url site area neighborhood address lat lon title price housing_type bedrooms "
+    "flooring is_furnished no_smoking ft2 laundry rent_period parking misc score",
+)
+RESPONSE_SIZES = (50, 500, 3000)
+# Keyword arguments of the default Flask JSON provider when serializing a response.
+DUMPS_KWARGS = {"sort_keys": True, "ensure_ascii": True, "separators": (",", ":")}
+
+
+def bench_serialize(sizes=RESPONSE_SIZES, repeat=5):
+    """Times serialization of housing API responses of `sizes` posts, building posts from rows
+    and dumping them to a JSON string. Returns a dictionary of response sizes and rows per second
+    before ('legacy' - `strftime` and the standard library's `json`) and after ('current')."""
+    app = Flask(__name__)
+    provider = get_json_provider("orjson")(app)
+    results = {}
+    for size in sizes:
+        rows = build_rows(size)
+        legacy = best_time(lambda: json.dumps([build_housing_post_legacy(row) for row in rows], **DUMPS_KWARGS), repeat)
+        current = best_time(lambda: provider.dumps_compact([build_housing_post(row) for row in rows]), repeat)
+        results[size] = {
+            "legacy": round(size / legacy),
+            "current": round(size / current),
+            "speedup": round(legacy / current, 2),
+        }
+    return results
+
+
+def best_time(fn, repeat):
+    """Returns the fastest of `repeat` calls to `fn` in seconds."""
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def build_rows(size, seed=0):
+    """Returns `size` synthetic rows resembling those selected by `select_housing_content`."""
+    rand = random.Random(seed)
+    now = datetime(2022, 1, 1)
+    return [
+        HousingRow(
+            id=str(i),
+            repost_of=None,
+            last_updated=now - timedelta(minutes=rand.randrange(60 * 24 * 30)),
+            url=f"https://sfbay.craigslist.org/eby/apa/d/{i}.html",
+            site="sfbay",
+            area=rand.choice(("eby", "sfc", "sby", "pen")),
+            neighborhood=rand.choice(("oakland", "berkeley", "mission district", "san josé")),
+            address="123 Main St",
+            lat=37 + rand.random(),
+            lon=-122 + rand.random(),
+            title="Sunny 2BR with in-unit laundry",
+            price=rand.randrange(1000, 6000),
+            housing_type="apartment",
+            bedrooms=float(rand.randrange(4)),
+            flooring="wood floors",
+            is_furnished=False,
+            no_smoking=True,
+            ft2=rand.randrange(300, 2000),
+            laundry="w/d in unit",
+            rent_period="monthly",
+            parking="off-street parking",
+            misc="cats are OK - purrr;dogs are OK - wooof",
+            score=rand.uniform(-100, 100),
+        )
+        for i in range(size)
+    ]
+
+
+def build_housing_post_legacy(post):
+    """Builds a detailed post dictionary as `build_housing_post` did before rows were converted
+    with `_asdict` and dates formatted with `isoformat`."""
+    return {
+        "id": post.id,
+        "repost_of": post.repost_of,
+        "last_updated": datetime.strftime(post.last_updated, "%Y-%m-%d %H:%M"),
+        "url": post.url,
+        "site": post.site,
+        "area": post.area,
+        "neighborhood": post.neighborhood,
+        "address": post.address,
+        "lat": post.lat,
+        "lon": post.lon,
+        "title": post.title,
+        "price": f"${post.price}",
+        "housing_type": post.housing_type,
+        "bedrooms": int(post.bedrooms),
+        "flooring": post.flooring,
+        "is_furnished": post.is_furnished,
+        "no_smoking": post.no_smoking,
+        "ft2": post.ft2,
+        "laundry": post.laundry,
+        "rent_period": post.rent_period,
+        "parking": post.parking,
+        "misc": post.misc.split(";"),
+        "score": int(post.score),
+    }
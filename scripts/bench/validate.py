@@ -0,0 +1,66 @@
+"""
+/scripts/bench/validate.py
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to benchmark validation of housing API request args.
+"""
+
+from cerberus import Validator
+
+from irahorecka.api.craigslisthousing.read.posts import (
+    validate_request_args,
+    REQUEST_ARGS_SCHEMA,
+    REQUEST_ARGS_VALIDATOR,
+)
+from scripts.bench.serialize import best_time
+
+# Request args of common housing API queries, and of a query failing validation.
+REQUEST_ARGS = {
+    "default": {"site": "sfbay"},
+    "filtered": {
+        "site": "sfbay",
+        "area": "eby",
+        "neighborhood": "oakland",
+        "housing_type": "apartment",
+        "min_price": "1500",
+        "max_price": "3000",
+        "min_bedrooms": "1",
+        "sort_by": "score_desc",
+        "limit": "100",
+    },
+    "invalid": {"site": "sfbay", "housing_type": "castle", "min_price": "cheap"},
+}
+
+
+def bench_validate(request_args=None, number=200, repeat=5):
+    """Times validation and normalization of housing API `request_args` (a dictionary of names and request
+    args, default `REQUEST_ARGS`), `number` times per run. Returns a dictionary of names and validations per
+    second before ('legacy' - a `Validator` built per call, normalizing twice) and after, for args seen for
+    the first time ('cold' - the cache is cleared before each call) and repeated args ('warm')."""
+    results = {}
+    for name, args in (request_args or REQUEST_ARGS).items():
+        legacy = best_time(lambda: [validate_request_args_legacy(dict(args)) for _ in range(number)], repeat)
+        cold = best_time(lambda: [validate_request_args_cold(dict(args)) for _ in range(number)], repeat)
+        warm = best_time(lambda: [validate_request_args(dict(args)) for _ in range(number)], repeat)
+        results[name] = {
+            "legacy": round(number / legacy),
+            "cold": round(number / cold),
+            "warm": round(number / warm),
+            "cold_speedup": round(legacy / cold, 2),
+            "warm_speedup": round(legacy / warm, 2),
+        }
+    return results
+
+
+def validate_request_args_cold(request_args):
+    """Validates request args with `validate_request_args`, missing its cache of validation results."""
+    REQUEST_ARGS_VALIDATOR.cache_clear()
+    return validate_request_args(request_args)
+
+
+def validate_request_args_legacy(request_args):
+    """Validates request args as `validate_request_args` did before its `Validator` was built once."""
+    v = Validator(REQUEST_ARGS_SCHEMA)
+    if not v.validate(request_args):
+        return (False, v.errors)
+    return (True, v.normalized(request_args))
@@ -7,5 +7,5 @@ Concerns all things database write and update.
 from functools import partial
 
 from irahorecka import create_app
-from scripts.db.setup import setup
+from scripts.db.setup import setup, check_indexes
 from scripts.db.update import update_github, update_housing, update_housing_score, rm_expired_housing
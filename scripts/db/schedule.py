@@ -0,0 +1,44 @@
+"""
+/scripts/db/schedule.py
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to run database updates of many Craigslist housing sites concurrently.
+"""
+
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from irahorecka.models import db
+
+SiteUpdate = namedtuple("SiteUpdate", "site results timings error")
+
+
+def run_site_updates(app, sites, stages, max_parallel=1):
+    """ENTRY POINT: Runs `stages`, a list of tuples of a name and a function taking a site and its areas,
+    for every site in dictionary `sites` mapping sites to their areas. Up to `max_parallel` sites are updated
+    at once, each in its own thread and application context. Returns a list of `SiteUpdate`, one per site in
+    the order of `sites` - a failed site doesn't affect the others."""
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        futures = [executor.submit(run_site_update, app, site, areas, stages) for site, areas in sites.items()]
+        return [future.result() for future in futures]
+
+
+def run_site_update(app, site, areas, stages):
+    """Runs `stages` in order for `site` and `areas`, timing each stage in seconds. Stops at the first stage
+    that raises - the `SiteUpdate` holds the results of the stages that ran and the formatted traceback."""
+    results = {}
+    timings = {}
+    with app.app_context():
+        for name, stage in stages:
+            start = time.perf_counter()
+            try:
+                results[name] = stage(site, areas)
+            except Exception:
+                # Leave the session usable for the next site run in this thread.
+                db.session.rollback()
+                return SiteUpdate(site, results, timings, traceback.format_exc())
+            finally:
+                timings[name] = round(time.perf_counter() - start, 2)
+    return SiteUpdate(site, results, timings, None)
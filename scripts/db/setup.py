@@ -5,12 +5,178 @@
 Module for database setup.
 """
 
+import re
+
+from sqlalchemy import bindparam, exists, inspect, select, text, update
+
 from irahorecka import db
+from irahorecka.api.craigslisthousing.read.geo import get_geocell
+from irahorecka.api.craigslisthousing.read.search import create_search_index
+from irahorecka.api.craigslisthousing.write.duplicate import write_duplicate_signatures, DUPLICATE_THRESHOLD
+from irahorecka.api.craigslisthousing.read.posts import (
+    parse_request_args,
+    query_craigslist_housing,
+    select_housing_content,
+)
+from irahorecka.models import CraigslistHousing, CraigslistHousingSignature
 from scripts.mail import email_if_exception
 
+# Common housing API query shapes as (request args, sort_by) - see `check_indexes`.
+HOUSING_API_QUERIES = {
+    "site_date_desc": ({"site": "sfbay"}, "date_desc"),
+    "site_area_date_desc": ({"site": "sfbay", "area": "eby"}, "date_desc"),
+    "site_area_score_desc": ({"site": "sfbay", "area": "eby"}, "score_desc"),
+    "site_neighborhood": ({"site": "sfbay", "neighborhood": "oakland"}, "date_desc"),
+    "site_housing_type": ({"site": "sfbay", "housing_type": "apartment"}, "date_desc"),
+    "site_near": ({"site": "sfbay", "near": "37.80,-122.27", "radius_km": 5}, "date_desc"),
+    "site_search": ({"site": "sfbay", "q": "hardwood"}, "relevance_desc"),
+}
+# Indexes serving each query of `HOUSING_API_QUERIES` by database dialect - any one of them will do. Dialects
+# without an entry expect the 'default' indexes.
+HOUSING_API_QUERY_INDEXES = {
+    "site_date_desc": {"default": ("ix_craigslisthousing_site_last_updated",)},
+    "site_area_date_desc": {"default": ("ix_craigslisthousing_site_area_last_updated",)},
+    "site_area_score_desc": {"default": ("ix_craigslisthousing_site_area_score",)},
+    # B-tree indexes can't serve substring filters - SQLite narrows posts by site instead.
+    "site_neighborhood": {
+        "postgresql": ("ix_craigslisthousing_neighborhood_trgm",),
+        "default": ("ix_craigslisthousing_site_last_updated",),
+    },
+    # Housing types are shared by many posts - reading a site's newest posts until the page is full is as good.
+    "site_housing_type": {"default": ("ix_craigslisthousing_housing_type", "ix_craigslisthousing_site_last_updated")},
+    "site_near": {"postgresql": ("ix_craigslisthousing_point",), "default": ("ix_craigslisthousing_site_geocell",)},
+    # SQLite searches its FTS5 table - see `create_search_index`.
+    "site_search": {"postgresql": ("ix_craigslisthousing_search",), "default": ("craigslisthousing_search",)},
+}
+# Columns declared on `CraigslistHousing` after table creation - added by `setup` if missing.
+ADDED_COLUMNS = ("geocell",)
+# Number of posts updated per batch when backfilling columns.
+BACKFILL_BATCH_SIZE = 10_000
+# Number of posts signed per batch when backfilling signatures - as many as written per transaction at ingest.
+SIGNATURE_BATCH_SIZE = 500
+
 
 @email_if_exception
 def setup(app):
-    """Sets up database models."""
+    """Sets up database models and indexes."""
     with app.app_context():
+        if db.engine.dialect.name == "postgresql":
+            # Required by the trigram index declared on `CraigslistHousing`.
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db.session.commit()
         db.create_all()
+        # `create_all` skips tables that already exist - migrate columns and indexes declared after table creation.
+        add_missing_columns(CraigslistHousing.__table__, ADDED_COLUMNS)
+        for index in CraigslistHousing.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+        backfill_geocells()
+        create_search_index()
+        backfill_duplicate_signatures(app.config.get("DUPLICATE_THRESHOLD", DUPLICATE_THRESHOLD))
+
+
+def add_missing_columns(table, names):
+    """Adds columns `names` of `table` to the database's table if missing. Added columns are null."""
+    existing = {column["name"] for column in inspect(db.engine).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column_type = table.c[name].type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+    db.session.commit()
+
+
+def backfill_geocells():
+    """Sets `CraigslistHousing.geocell` of posts written before it was declared. Posts without coordinates
+    keep a null cell."""
+    posts = db.session.execute(
+        select(CraigslistHousing.id, CraigslistHousing.lat, CraigslistHousing.lon).where(
+            CraigslistHousing.geocell.is_(None)
+        )
+    ).all()
+    rows = [{"post_id": post.id, "geocell": get_geocell(post.lat, post.lon)} for post in posts]
+    rows = [row for row in rows if row["geocell"] is not None]
+    for i in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        db.session.execute(
+            update(CraigslistHousing.__table__).where(CraigslistHousing.id == bindparam("post_id")),
+            rows[i : i + BACKFILL_BATCH_SIZE],
+        )
+        db.session.commit()
+
+
+def backfill_duplicate_signatures(threshold=DUPLICATE_THRESHOLD):
+    """Signs posts written before near duplicates were detected at ingest, oldest first, marking near
+    duplicates with a similarity of at least `threshold` as `write_duplicate_signatures` would."""
+    posts = db.session.execute(
+        select(
+            CraigslistHousing.id,
+            CraigslistHousing.site,
+            CraigslistHousing.neighborhood,
+            CraigslistHousing.title,
+            CraigslistHousing.bedrooms,
+        )
+        .where(~exists().where(CraigslistHousingSignature.post_id == CraigslistHousing.id))
+        .order_by(CraigslistHousing.id)
+    ).all()
+    for i in range(0, len(posts), SIGNATURE_BATCH_SIZE):
+        write_duplicate_signatures([post._asdict() for post in posts[i : i + SIGNATURE_BATCH_SIZE]], threshold)
+        db.session.commit()
+
+
+@email_if_exception
+def check_indexes(app):
+    """Runs EXPLAIN on common housing API queries. Returns a dictionary of query names and whether
+    the query plan uses the index expected to serve the query (see `HOUSING_API_QUERY_INDEXES`)
+    without scanning a table or index in full."""
+    with app.app_context():
+        # Planners pick indexes by the table's statistics - refresh them first.
+        db.session.execute(text(f"ANALYZE {CraigslistHousing.__tablename__}"))
+        db.session.commit()
+        dialect = db.engine.dialect.name
+        uses_indexes = {}
+        for name, (request_args, sort_by) in HOUSING_API_QUERIES.items():
+            indexes = HOUSING_API_QUERY_INDEXES[name]
+            plan = explain(build_housing_api_query(request_args, sort_by))
+            uses_indexes[name] = uses_index(plan, indexes.get(dialect, indexes["default"]))
+        return uses_indexes
+
+
+def build_housing_api_query(request_args, sort_by):
+    """Builds the query served by the housing API for `request_args` and `sort_by`."""
+    v_args = parse_request_args(request_args, sort_by, None, None)
+    return select_housing_content(query_craigslist_housing(v_args), q=v_args["q"]).limit(v_args["limit"])
+
+
+def uses_index(plan, indexes):
+    """Returns True if query plan lines `plan` (see `explain`) use one of `indexes` and scan no table or index
+    in full."""
+    if any(is_full_scan(plan, i) for i in range(len(plan))):
+        return False
+    return any(re.search(rf"\b{re.escape(index)}\b", line) for line in plan for index in indexes)
+
+
+def is_full_scan(plan, i):
+    """Returns True if line `i` of query plan lines `plan` scans a table or index in full - a sequential scan
+    on PostgreSQL, or an index scan without an index condition. SQLite searches (SEARCH) by index, and scans
+    (SCAN) otherwise - scans of virtual tables (e.g. FTS5) are searches of their own index."""
+    line = plan[i].strip()
+    if line.startswith("SCAN "):
+        return "VIRTUAL TABLE" not in line
+    if "Seq Scan" in line:
+        return True
+    if re.search(r"Index (Only )?Scan (Backward )?using", line):
+        # Properties of a PostgreSQL plan node follow its line, up to the next node ('->').
+        properties = []
+        for next_line in plan[i + 1 :]:
+            if "->" in next_line:
+                break
+            properties.append(next_line)
+        return not any("Index Cond:" in next_line for next_line in properties)
+    return False
+
+
+def explain(query):
+    """Returns the lines of the database's query plan for `query`."""
+    dialect = db.engine.dialect
+    statement = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    # PostgreSQL yields one line per row, SQLite's plan detail is the last column of each row.
+    prefix = "EXPLAIN QUERY PLAN" if dialect.name == "sqlite" else "EXPLAIN"
+    return [str(row[-1]) for row in db.session.execute(text(f"{prefix} {statement}"))]
@@ -5,7 +5,13 @@
 Module for database updates.
 """
 
+import os
+
+from flask import current_app
+
 import irahorecka.api as api
+from irahorecka.exceptions import UpdateError
+from scripts.db.schedule import run_site_updates
 from scripts.mail import email_if_exception
 
 
@@ -18,22 +24,90 @@ def update_github(app):
 
 @email_if_exception
 def update_housing(app):
-    """Update database with Craigslist housing information."""
-    with app.app_context():
-        # The following calls must go in this order.
-        api.write_craigslist_housing(site="sfbay", areas=["eby", "nby", "sby", "sfc", "pen", "scz"])
-        api.clean_craigslist_housing()
+    """Update database with Craigslist housing information of every registered site - see config.yaml."""
+    # The following stages must go in this order.
+    run_housing_updates(
+        app,
+        [
+            ("ingest", ingest_housing),
+            ("clean", clean_housing),
+            ("map", map_housing),
+            ("score", score_housing),
+            ("stats", stats_housing),
+        ],
+    )
 
 
 @email_if_exception
 def update_housing_score(app):
-    """Updates Craigslist housing table with post scores."""
-    with app.app_context():
-        api.write_craigslist_housing_score(site="sfbay", areas=["eby", "nby", "sby", "sfc", "pen", "scz"])
+    """Updates Craigslist housing table with post scores of every registered site - see config.yaml. Market
+    statistics are refreshed after scoring."""
+    run_housing_updates(app, [("score", score_housing), ("stats", stats_housing)])
 
 
 @email_if_exception
 def rm_expired_housing(app):
-    """Removes expired Craigslist housing posts from table in database."""
+    """Removes expired Craigslist housing posts from table in database. Map clusters and market statistics
+    are refreshed if any post was removed."""
     with app.app_context():
-        api.rm_expired_craigslist_housing()
+        counts = api.rm_expired_craigslist_housing()
+        print(f"Craigslist housing: {counts['checked']} checked, {counts['removed']} expired posts removed")
+    if counts["removed"]:
+        run_housing_updates(app, [("map", map_housing), ("stats", stats_housing)])
+
+
+def run_housing_updates(app, stages):
+    """Runs `stages` for every registered Craigslist housing site and prints each site's results and
+    timings. Raises UpdateError once every site ran if any site failed."""
+    updates = run_site_updates(
+        app, api.HOUSING_CONFIG["sites"], stages, max_parallel=api.HOUSING_CONFIG["max-parallel-sites"]
+    )
+    for update in updates:
+        timings = ", ".join(f"{name} {seconds}s" for name, seconds in update.timings.items())
+        print(f"Craigslist housing ({update.site}): {'failed' if update.error else 'done'} in {timings}")
+        for name, result in update.results.items():
+            print(f"Craigslist housing ({update.site}): {name} {result}")
+    failed = [update for update in updates if update.error]
+    if failed:
+        raise UpdateError("\n".join(f"{update.site}:\n{update.error}" for update in failed))
+
+
+def ingest_housing(site, areas):
+    """Writes scraped Craigslist housing posts of `site` and `areas` to database."""
+    return api.write_craigslist_housing(
+        site=site,
+        areas=areas,
+        progress_path=get_site_path(current_app.config.get("SCRAPE_PROGRESS_PATH"), site),
+        duplicate_threshold=current_app.config.get("DUPLICATE_THRESHOLD", api.DUPLICATE_THRESHOLD),
+    )
+
+
+def clean_housing(site, areas):
+    """Removes Craigslist housing posts of `site` matching any cleaning rule from database."""
+    return api.clean_craigslist_housing(site=site)
+
+
+def map_housing(site, areas):
+    """Refreshes map clusters of Craigslist housing posts of `site`."""
+    return api.write_craigslist_housing_map(site=site)
+
+
+def score_housing(site, areas):
+    """Scores Craigslist housing posts of `site` and `areas`."""
+    return api.write_craigslist_housing_score(
+        site=site, areas=areas, processes=current_app.config.get("SCORE_PROCESSES", 1)
+    )
+
+
+def stats_housing(site, areas):
+    """Refreshes market statistics of Craigslist housing posts of `site`."""
+    return api.write_craigslist_housing_stats(site=site)
+
+
+def get_site_path(path, site):
+    """Returns file `path` with `site` inserted before its extension, so that concurrently updated sites
+    don't share a file. None if `path` is None."""
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}.{site}{ext}"
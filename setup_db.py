@@ -10,7 +10,7 @@ import os
 from dotenv import load_dotenv
 
 from irahorecka import create_app
-from scripts.db import setup
+from scripts.db import setup, check_indexes
 
 load_dotenv()
 application = create_app()
@@ -22,3 +22,6 @@ if __name__ == "__main__":
         # Unprotected key calls - trigger exception if key doesn't exist.
         os.environ[var]
     setup(application)
+    # Report common housing API queries that are not served by their index.
+    for query, uses_index in (check_indexes(application) or {}).items():
+        print(f"{query}: {'index' if uses_index else 'not served by its index'}")
@@ -0,0 +1,44 @@
+"""
+/tests/conftest.py
+~~~~~~~~~~~~~~~~~~
+
+Module to provide pytest fixtures of the Flask application, backed by an in-memory SQLite database.
+"""
+
+import os
+
+import pytest
+
+# Required by `irahorecka.config` at import - tests never read them.
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
+os.environ.setdefault("GITHUB_TOKEN", "test")
+
+from irahorecka import create_app, db, limiter
+from irahorecka.config import Config
+
+
+class TestConfig(Config):
+    """Flask app configuration of tests - never touches the configured database."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    CACHE_DIR = None
+
+
+@pytest.fixture(scope="session")
+def app():
+    """Flask application, created once per test session."""
+    application = create_app(TestConfig)
+    limiter.enabled = False
+    return application
+
+
+@pytest.fixture
+def app_context(app):
+    """Application context with empty database tables, dropped after the test."""
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
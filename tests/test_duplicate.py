@@ -0,0 +1,38 @@
+"""
+/tests/test_duplicate.py
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+Module to test detection of near-duplicate Craigslist housing posts.
+"""
+
+from irahorecka.api.craigslisthousing.write.duplicate import write_duplicate_signatures
+from irahorecka.models import db, CraigslistHousingSignature
+
+# Number of reposts of the same post, and number of posts written at once.
+REPOSTS = 600
+CHUNK_SIZE = 100
+
+
+def build_repost_rows():
+    """Returns a list of rows of `REPOSTS` reposts of the same post, oldest first."""
+    return [
+        {
+            "id": 7_000_000_000 + i,
+            "site": "sfbay",
+            "bedrooms": 2,
+            "neighborhood": "oakland",
+            "title": "Sunny 2BR/1BA with hardwood floors near Lake Merritt, parking included",
+        }
+        for i in range(REPOSTS)
+    ]
+
+
+def test_duplicates_are_counted_once(app_context):
+    """Reposts written over several chunks are each counted once, when first marked a duplicate - not
+    again when pointed to a newer repost, or when written again."""
+    rows = build_repost_rows()
+    counts = [write_duplicate_signatures(rows[i : i + CHUNK_SIZE]) for i in range(0, REPOSTS, CHUNK_SIZE)]
+    assert counts == [CHUNK_SIZE - 1] + [CHUNK_SIZE] * (REPOSTS // CHUNK_SIZE - 1)
+    assert write_duplicate_signatures(rows[:CHUNK_SIZE]) == 0
+    duplicate_of = dict(db.session.query(CraigslistHousingSignature.post_id, CraigslistHousingSignature.duplicate_of))
+    assert duplicate_of == {row["id"]: rows[-1]["id"] for row in rows[:-1]} | {rows[-1]["id"]: None}
@@ -0,0 +1,90 @@
+"""
+/tests/test_expire.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Module to test removal of expired Craigslist housing posts against a local stand-in for Craigslist.
+"""
+
+import datetime
+
+import httpx
+
+from irahorecka.api.craigslisthousing.update.expire import rm_expired_craigslist_housing
+from irahorecka.api.version import read_data_version
+from irahorecka.models import db, CraigslistHousing, CraigslistHousingCheck
+
+# Post IDs of each response of the stand-in for Craigslist.
+EXPIRED_ID = 7_000_000_001
+LIVE_ID = 7_000_000_002
+UNCHANGED_ID = 7_000_000_003
+UNREACHABLE_ID = 7_000_000_004
+# Validator of the unchanged post, sent by its previous check.
+UNCHANGED_ETAG = '"unchanged"'
+
+
+async def stream_body(*chunks):
+    """Streams `chunks` of a response body - <h2> elements may be split across chunks."""
+    for chunk in chunks:
+        yield chunk.encode()
+
+
+def handle_request(request):
+    """Responds to a request for a post as Craigslist would, by post ID in the URL."""
+    id_ = int(request.url.path.rsplit("/", 1)[-1].removesuffix(".html"))
+    if id_ == EXPIRED_ID:
+        body = stream_body(
+            "<html><body>" * 100,
+            "<h",
+            "2 class='post-not-found'>This posting has been ",
+            "deleted by its author.</h",
+            "2>",
+        )
+        return httpx.Response(200, content=body)
+    if id_ == LIVE_ID:
+        body = stream_body("<html><body><h2 class='postingtitle'>Sunny ", "studio</h2>", "<p>expired</p>")
+        return httpx.Response(200, headers={"ETag": '"live"'}, content=body)
+    if id_ == UNCHANGED_ID:
+        assert request.headers["If-None-Match"] == UNCHANGED_ETAG
+        return httpx.Response(304)
+    raise httpx.ConnectError("Connection refused", request=request)
+
+
+def add_housing_posts(now):
+    """Writes a post of each response to database. The unchanged post was checked before and is due."""
+    for id_ in (EXPIRED_ID, LIVE_ID, UNCHANGED_ID, UNREACHABLE_ID):
+        db.session.add(
+            CraigslistHousing(
+                id=id_,
+                site="sfbay",
+                area="sfc",
+                url=f"https://sfbay.craigslist.org/sfc/apa/d/{id_}.html",
+                last_updated=now - datetime.timedelta(days=2),
+            )
+        )
+    db.session.add(CraigslistHousingCheck(post_id=UNCHANGED_ID, etag=UNCHANGED_ETAG, next_check_at=now))
+    db.session.commit()
+
+
+def test_rm_expired_housing(app_context):
+    """Only the expired post is removed - live, unchanged and unreachable posts are kept with their check."""
+    add_housing_posts(datetime.datetime.now())
+    version, _ = read_data_version(CraigslistHousing.__tablename__)
+    result = rm_expired_craigslist_housing(transport=httpx.MockTransport(handle_request))
+    assert result == {"checked": 4, "removed": 1}
+    assert {post.id for post in CraigslistHousing.query} == {LIVE_ID, UNCHANGED_ID, UNREACHABLE_ID}
+    checks = {check.post_id: check for check in CraigslistHousingCheck.query}
+    assert set(checks) == {LIVE_ID, UNCHANGED_ID, UNREACHABLE_ID}
+    assert (checks[LIVE_ID].last_status, checks[LIVE_ID].etag) == (200, '"live"')
+    assert (checks[UNCHANGED_ID].last_status, checks[UNCHANGED_ID].etag) == (304, UNCHANGED_ETAG)
+    assert (checks[UNREACHABLE_ID].last_status, checks[UNREACHABLE_ID].etag) == (None, None)
+    assert read_data_version(CraigslistHousing.__tablename__)[0] == version + 1
+
+
+def test_rm_expired_housing_without_expired_posts(app_context):
+    """Posts aren't rechecked until due, and the data version is only bumped if posts were removed."""
+    add_housing_posts(datetime.datetime.now())
+    rm_expired_craigslist_housing(transport=httpx.MockTransport(handle_request))
+    version, _ = read_data_version(CraigslistHousing.__tablename__)
+    result = rm_expired_craigslist_housing(transport=httpx.MockTransport(handle_request))
+    assert result == {"checked": 0, "removed": 0}
+    assert read_data_version(CraigslistHousing.__tablename__)[0] == version
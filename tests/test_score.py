@@ -0,0 +1,95 @@
+"""
+/tests/test_score.py
+~~~~~~~~~~~~~~~~~~~~
+
+Module to test scoring of Craigslist housing posts against the SQL implementation it replaced.
+"""
+
+import datetime
+import random
+
+import pytest
+
+import legacy_score
+from irahorecka.api.craigslisthousing.update.score import write_craigslist_housing_score
+from irahorecka.models import db, CraigslistHousing
+
+# Site and areas scored by the tests. Posts of `UNSCORED_AREA` keep their score.
+SITE = "sfbay"
+AREAS = ("eby", "pen", "sfc")
+UNSCORED_AREA = "nby"
+# Number of posts per area - enough for percentiles to trim a few posts.
+POSTS_PER_AREA = 1500
+
+
+def build_housing_posts(posts_per_area=POSTS_PER_AREA, seed=0):
+    """Returns a list of CraigslistHousing posts of `SITE`, `posts_per_area` per area, with randomized prices
+    and units - including studios listed with bedrooms, 0-bedroom posts, posts without ft2 or price, and
+    stale or null scores."""
+    rng = random.Random(seed)
+    now = datetime.datetime(2021, 10, 17)
+    posts = []
+    for i, area in enumerate(area for area in (*AREAS, UNSCORED_AREA) for _ in range(posts_per_area)):
+        bedrooms = rng.choice([0, 1, 1, 2, 2, 3, 4, 8])
+        is_studio = rng.random() < 0.05
+        posts.append(
+            CraigslistHousing(
+                id=7_000_000_000 + i,
+                site=SITE,
+                area=area,
+                last_updated=now - datetime.timedelta(minutes=rng.randint(0, 10_000)),
+                title=f"{'Sunny STUDIO' if is_studio else 'Apartment'} {i}",
+                neighborhood="",
+                price=rng.choice([0, *(rng.randint(800, 8000) for _ in range(20))]),
+                bedrooms=1 if is_studio else bedrooms,
+                ft2=rng.choice([0, 0, rng.randint(250, 3000)]),
+                # Scores of a previous scoring, or never scored.
+                score=rng.choice([None, 0, round(rng.uniform(-100, 100))]),
+            )
+        )
+    return posts
+
+
+def score_housing_posts(score, posts_per_area=POSTS_PER_AREA):
+    """Writes `build_housing_posts` to database, scores them with function `score` and returns a dictionary
+    of post IDs mapped to a tuple of their bedrooms and score."""
+    db.session.query(CraigslistHousing).delete()
+    db.session.add_all(build_housing_posts(posts_per_area))
+    db.session.commit()
+    score(SITE, AREAS)
+    db.session.expire_all()
+    return {post.id: (post.bedrooms, post.score) for post in CraigslistHousing.query}
+
+
+# Larger fixtures trim more posts by percentile - small differences in percentiles show in scores.
+@pytest.mark.parametrize("posts_per_area", [POSTS_PER_AREA, 5000])
+def test_full_scoring_matches_legacy(app_context, posts_per_area):
+    """Full scoring in memory gives every post the same bedrooms and score as the SQL implementation."""
+    legacy_scores = score_housing_posts(legacy_score.write_craigslist_housing_score, posts_per_area)
+    scores = score_housing_posts(write_craigslist_housing_score, posts_per_area)
+    assert all(score is not None for _, score in scores.values())
+    assert scores == legacy_scores
+
+
+def test_unscored_area_keeps_scores(app_context):
+    """Posts outside the scored areas keep their score - null scores are set to 0."""
+    posts = {post.id: post.score for post in build_housing_posts() if post.area == UNSCORED_AREA}
+    scores = score_housing_posts(write_craigslist_housing_score)
+    assert all(scores[id_][1] == (score or 0) for id_, score in posts.items())
+
+
+def test_incremental_scoring_skips_other_areas(app_context):
+    """Incremental scoring only scores new posts of the scored areas - posts of other areas are left
+    unscored until their area is scored."""
+    score_housing_posts(write_craigslist_housing_score)
+    new_posts = build_housing_posts(seed=1)[:: POSTS_PER_AREA // 10]
+    for i, post in enumerate(new_posts):
+        post.id = 8_000_000_000 + i
+        post.score = None
+    db.session.add_all(new_posts)
+    db.session.commit()
+    result = write_craigslist_housing_score(SITE, AREAS)
+    scores = dict(db.session.query(CraigslistHousing.id, CraigslistHousing.score).filter(CraigslistHousing.id >= 8e9))
+    assert not result["full"]
+    assert result["scored"] == sum(post.area in AREAS for post in new_posts)
+    assert all((scores[post.id] is None) == (post.area == UNSCORED_AREA) for post in new_posts)
@@ -0,0 +1,110 @@
+"""
+/tests/test_scrape.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Module to test concurrent scrapes of Craigslist housing posts against a local stand-in for Craigslist.
+"""
+
+import threading
+
+from requests.exceptions import ConnectionError
+
+from irahorecka.api.craigslisthousing.write import scrape
+from irahorecka.api.craigslisthousing.write.scrape import ApaScraper, ApaTask, ScrapeProgress
+
+# Site and area scraped by the tests - one task per price band of the area.
+SITE = "sfbay"
+AREAS = ("eby",)
+# Number of posts of each task.
+POSTS_PER_TASK = 3
+
+
+class StubApa:
+    """Stand-in for `pycraigslist.housing.apa`. Requests of tasks in `failures` raise ConnectionError
+    the number of times mapped to the task - every time if mapped to None."""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, site, area, filters):
+        task = ApaTask(site, area, filters["min_price"], filters["max_price"])
+        with self._lock:
+            self.requests.append(task)
+            failures = self.failures.get(task, 0)
+            if failures is None or failures > 0:
+                self.failures[task] = None if failures is None else failures - 1
+                return StubSearch(task, error=ConnectionError(f"{task} is down"))
+        return StubSearch(task)
+
+
+class StubSearch:
+    """Search of `StubApa` - yields `POSTS_PER_TASK` detailed posts, or raises `error` on the first request."""
+
+    def __init__(self, task, error=None):
+        self.task = task
+        self.error = error
+
+    def search_detail(self):
+        if self.error is not None:
+            raise self.error
+        for i in range(POSTS_PER_TASK):
+            yield {"id": f"{self.task.area}-{self.task.min_price}-{i}", "price": f"${self.task.min_price}"}
+
+
+def run_scrape(scraper):
+    """Runs `scraper` to completion and returns a dictionary of tasks mapped to their scraped posts."""
+    posts = {}
+    for task, post in scraper.scrape():
+        posts.setdefault(task, [])
+        if post is not None:
+            posts[task].append(post)
+    return posts
+
+
+def test_scrape_retries_failed_requests(monkeypatch):
+    """Tasks whose requests fail fewer times than the attempts back off with `sleep` and complete."""
+    monkeypatch.setattr(scrape, "get_backoff", lambda attempt, base: 1)
+    tasks = list(ApaScraper(SITE, AREAS).tasks)
+    apa = StubApa({tasks[0]: 2, tasks[1]: 1})
+    sleeps = []
+    scraper = ApaScraper(SITE, AREAS, apa=apa, requests_per_second=1e9, attempts=3, sleep=sleeps.append)
+    posts = run_scrape(scraper)
+    assert sorted(scraper.completed) == sorted(tasks)
+    assert not scraper.failed
+    assert all(len(posts[task]) == POSTS_PER_TASK for task in tasks)
+    assert apa.requests.count(tasks[0]) == 3
+    assert apa.requests.count(tasks[1]) == 2
+    # One backoff per failed request - the rate limiter waits far less.
+    assert sleeps.count(1) == 3
+
+
+def test_scrape_collects_failed_task():
+    """A task that fails every attempt is collected in `failed` - other tasks complete."""
+    tasks = list(ApaScraper(SITE, AREAS).tasks)
+    apa = StubApa({tasks[0]: None})
+    scraper = ApaScraper(SITE, AREAS, apa=apa, attempts=3, backoff_base=1, sleep=lambda seconds: None)
+    posts = run_scrape(scraper)
+    assert scraper.failed == [tasks[0]]
+    assert sorted(scraper.completed) == sorted(tasks[1:])
+    assert tasks[0] not in posts
+    assert apa.requests.count(tasks[0]) == 3
+
+
+def test_scrape_resumes_from_progress(tmp_path):
+    """A scrape resumed from the progress file of a previous scrape skips tasks marked done."""
+    path = tmp_path / "progress.json"
+    tasks = list(ApaScraper(SITE, AREAS).tasks)
+    apa = StubApa({tasks[-1]: None})
+    scraper = ApaScraper(SITE, AREAS, ScrapeProgress(path), apa=apa, attempts=1, sleep=lambda seconds: None)
+    run_scrape(scraper)
+    scraper.progress.mark_done(scraper.completed)
+    assert scraper.failed == [tasks[-1]]
+
+    apa = StubApa()
+    scraper = ApaScraper(SITE, AREAS, ScrapeProgress(path), apa=apa, sleep=lambda seconds: None)
+    posts = run_scrape(scraper)
+    assert apa.requests == [tasks[-1]]
+    assert scraper.completed == [tasks[-1]]
+    assert len(posts[tasks[-1]]) == POSTS_PER_TASK